@@ -0,0 +1,338 @@
+import re
+import json
+import time
+import zlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from xml.sax.saxutils import escape
+
+# Local stand-ins for E-utilities, the Elsevier APIs and the Zotero web API.
+# Payloads are synthetic but shaped like the real ones: large efetch XML,
+# paged Zotero listings with attachment children, multi-page PDFs. Every
+# response is delayed by `latency` seconds to model the network.
+#
+# Record identities are derived from the query text, so PubMed and Elsevier
+# return overlapping DOIs for the same query (exercising /litsearch dedup)
+# while different queries return different records (defeating the caches).
+
+SECTIONS = ["Abstract", "Introduction", "Methods", "Results", "Discussion", "Conclusion", "References"]
+WORDS = (
+    "patients cohort outcome radiomics survival imaging treatment analysis model clinical "
+    "spinal metastasis tumour response risk trial data features validation accuracy"
+).split()
+
+def id_base(query: str) -> int:
+    return 1_000_000 + (zlib.crc32(query.encode()) % 100_000) * 100
+
+def doi_for(pmid) -> str:
+    return f"10.5555/bench.{pmid}"
+
+def sentence(seed: int, words: int = 14) -> str:
+    return " ".join(WORDS[(seed * 7 + i * 3) % len(WORDS)] for i in range(words)).capitalize() + "."
+
+def make_pdf(pages: int) -> bytes:
+    import fitz  # PyMuPDF; only the fake Zotero file endpoint needs it
+
+    doc = fitz.open()
+    per_page = max(1, pages // len(SECTIONS))
+    for n in range(pages):
+        page = doc.new_page()
+        lines = []
+        if n % per_page == 0 and n // per_page < len(SECTIONS):
+            lines.append(SECTIONS[n // per_page])
+        lines.extend(sentence(n * 50 + i, 10) for i in range(45))
+        page.insert_text((50, 60), "\n".join(lines), fontsize=9)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    upstream = None  # set per server
+
+    def log_message(self, *args):
+        pass
+
+    def _respond(self, status: int, body=b"", content_type="application/json", headers=None):
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body).encode()
+        elif isinstance(body, str):
+            body = body.encode()
+        time.sleep(self.upstream.latency)
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, str(value))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _params(self) -> dict:
+        url = urlparse(self.path)
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            body = self.rfile.read(length).decode()
+            if self.headers.get("Content-Type", "").startswith("application/json"):
+                params["_json"] = json.loads(body)
+            else:
+                params.update({k: v[-1] for k, v in parse_qs(body).items()})
+        return params
+
+    def _dispatch(self, method: str):
+        path = urlparse(self.path).path
+        params = self._params()
+        self.upstream.requests += 1
+        try:
+            self.upstream.handle(self, method, path, params)
+        except Exception as e:
+            self._respond(500, {"error": str(e)})
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_PUT(self):
+        self._dispatch("PUT")
+
+class FakeUpstream:
+    def __init__(self, latency: float = 0.05):
+        self.latency = latency
+        self.requests = 0
+        self._server = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    def start(self):
+        handler = type(f"{type(self).__name__}Handler", (_Handler,), {"upstream": self})
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+class FakeEutils(FakeUpstream):
+    # esearch (plain and usehistory), epost, efetch (ids or history), esummary
+    def __init__(self, latency: float = 0.05, count: int = 2000, abstract_sentences: int = 12):
+        super().__init__(latency)
+        self.count = count
+        self.abstract_sentences = abstract_sentences
+        self._posted = {}
+
+    def _history_ids(self, webenv: str, retstart: int, retmax: int) -> list:
+        if webenv in self._posted:
+            return self._posted[webenv][retstart:retstart + retmax]
+        base = id_base(webenv.removeprefix("term:"))
+        return [base + i for i in range(retstart, min(self.count, retstart + retmax))]
+
+    def article_xml(self, pmid) -> str:
+        seed = int(pmid)
+        abstract = " ".join(sentence(seed + i) for i in range(self.abstract_sentences))
+        return (
+            "<PubmedArticle><MedlineCitation><PMID>{pmid}</PMID><Article>"
+            "<Journal><JournalIssue><Volume>{vol}</Volume><Issue>2</Issue>"
+            "<PubDate><Year>{year}</Year><Month>Mar</Month></PubDate></JournalIssue>"
+            "<Title>Journal of Benchmarks</Title><ISOAbbreviation>J Bench</ISOAbbreviation></Journal>"
+            "<ArticleTitle>{title}</ArticleTitle><Pagination><MedlinePgn>1-10</MedlinePgn></Pagination>"
+            "<ELocationID EIdType=\"doi\">{doi}</ELocationID>"
+            "<Abstract><AbstractText Label=\"BACKGROUND\">{abstract}</AbstractText></Abstract>"
+            "<AuthorList><Author><LastName>Smith</LastName><ForeName>Ann</ForeName><Initials>A</Initials></Author>"
+            "<Author><LastName>Jones</LastName><ForeName>Bo</ForeName><Initials>B</Initials></Author></AuthorList>"
+            "</Article></MedlineCitation></PubmedArticle>"
+        ).format(
+            pmid=pmid, vol=seed % 50, year=2000 + seed % 25, title=escape(f"Study {pmid}: {sentence(seed, 8)}"),
+            doi=doi_for(pmid), abstract=escape(abstract)
+        )
+
+    def handle(self, req, method, path, params):
+        name = path.rsplit("/", 1)[-1]
+        if name == "esearch.fcgi":
+            term = params.get("term", "")
+            base = id_base(term)
+            retmax = min(int(params.get("retmax", 20)), self.count)
+            result = {"count": str(self.count), "idlist": [str(base + i) for i in range(retmax)]}
+            if params.get("usehistory") == "y":
+                result.update({"webenv": f"term:{term}", "querykey": "1"})
+            return req._respond(200, {"esearchresult": result})
+        if name == "epost.fcgi":
+            webenv = f"post:{len(self._posted)}"
+            self._posted[webenv] = params.get("id", "").split(",")
+            return req._respond(
+                200, f"<ePostResult><QueryKey>1</QueryKey><WebEnv>{webenv}</WebEnv></ePostResult>",
+                content_type="text/xml"
+            )
+        if name == "efetch.fcgi":
+            if params.get("id"):
+                ids = params["id"].split(",")
+            else:
+                ids = self._history_ids(params["WebEnv"], int(params.get("retstart", 0)), int(params.get("retmax", 20)))
+            body = "<PubmedArticleSet>" + "".join(self.article_xml(pmid) for pmid in ids) + "</PubmedArticleSet>"
+            return req._respond(200, body, content_type="text/xml")
+        if name == "esummary.fcgi":
+            ids = params.get("id", "").split(",")
+            result = {
+                pmid: {"title": f"Study {pmid}", "fulljournalname": "Journal of Benchmarks", "pubdate": "2020 Mar"}
+                for pmid in ids
+            }
+            return req._respond(200, {"result": {"uids": ids, **result}})
+        req._respond(404, {"error": f"Unknown E-utility {name}"})
+
+class FakeElsevier(FakeUpstream):
+    # Scopus search (offset and cursor), ScienceDirect search (GET and PUT),
+    # article retrieval by DOI
+    def __init__(self, latency: float = 0.05, count: int = 500, paragraphs: int = 60):
+        super().__init__(latency)
+        self.count = count
+        self.paragraphs = paragraphs
+
+    def _entry(self, pmid) -> dict:
+        seed = int(pmid)
+        return {
+            "dc:title": f"Study {pmid}: {sentence(seed, 8)}",
+            "prism:doi": doi_for(pmid),
+            "dc:creator": "Smith A.",
+            "prism:publicationName": "Journal of Benchmarks",
+            "prism:coverDate": f"{2000 + seed % 25}-03-01",
+            "prism:url": f"https://api.elsevier.com/content/abstract/scopus_id/{pmid}",
+            "eid": f"2-s2.0-{pmid}",
+            "openaccessFlag": seed % 2 == 0,
+            "link": [{"@ref": "scopus", "@href": f"https://www.scopus.com/{pmid}"}]
+        }
+
+    def handle(self, req, method, path, params):
+        if path == "/content/search/sciencedirect" and method == "PUT":
+            body = params.get("_json", {})
+            base = id_base(body.get("qs", ""))
+            offset = int(body.get("display", {}).get("offset", 0))
+            show = int(body.get("display", {}).get("show", 25))
+            results = [
+                {"title": f"Study {base + i}", "doi": doi_for(base + i), "authors": [{"name": "Smith A."}],
+                 "sourceTitle": "Journal of Benchmarks", "publicationDate": "2020-03-01",
+                 "uri": f"https://www.sciencedirect.com/{base + i}", "pii": f"S{base + i}", "openAccess": False}
+                for i in range(offset, min(self.count, offset + show))
+            ]
+            return req._respond(200, {"resultsFound": self.count, "results": results})
+        if path in ("/content/search/scopus", "/content/search/sciencedirect"):
+            base = id_base(params.get("query", ""))
+            count = int(params.get("count", 25))
+            cursor = params.get("cursor")
+            start = int(params.get("start", 0)) if cursor is None else (0 if cursor == "*" else int(cursor))
+            entries = [self._entry(base + i) for i in range(start, min(self.count, start + count))]
+            results = {"opensearch:totalResults": str(self.count), "entry": entries}
+            if cursor is not None:
+                results["cursor"] = {"@next": str(start + len(entries))}
+            return req._respond(200, {"search-results": results})
+        match = re.match(r"^/content/article/doi/(.+)$", path)
+        if match:
+            seed = zlib.crc32(match.group(1).encode())
+            text = "\n\n".join(
+                " ".join(sentence(seed + p * 10 + i) for i in range(6)) for p in range(self.paragraphs)
+            )
+            return req._respond(200, {"full-text-retrieval-response": {"originalText": text}})
+        req._respond(404, {"error": f"Unknown Elsevier path {path}"})
+
+class FakeZotero(FakeUpstream):
+    # One library with a "Bench" collection of `items` journal articles, each
+    # with a PDF attachment child; supports paging, versions, ?since= and
+    # writes (collections, items)
+    def __init__(self, latency: float = 0.05, items: int = 200, pdf_pages: int = 30):
+        super().__init__(latency)
+        self.pdf = make_pdf(pdf_pages)
+        self.collections = [{"key": "BENCH001", "version": 1, "data": {"key": "BENCH001", "name": "Bench"}}]
+        self.version = 1
+        self.library = []
+        for i in range(items):
+            parent, attachment = f"P{i:07d}", f"A{i:07d}"
+            self.library.append({"key": parent, "version": 1, "data": {
+                "key": parent, "itemType": "journalArticle", "title": f"Benchmark article {i}",
+                "creators": [{"lastName": "Smith"}], "date": "2020", "url": f"https://example.org/{i}",
+                "DOI": doi_for(2_000_000 + i), "collections": ["BENCH001"],
+                "dateModified": f"2024-01-01T00:{i // 60 % 60:02d}:{i % 60:02d}Z"
+            }})
+            self.library.append({"key": attachment, "version": 1, "data": {
+                "key": attachment, "itemType": "attachment", "parentItem": parent,
+                "contentType": "application/pdf", "md5": f"{i:032x}", "mtime": 1700000000000,
+                "dateModified": "2024-01-01T00:00:00Z"
+            }})
+        self._lock = threading.Lock()
+
+    def _page(self, req, items: list, params: dict):
+        start, limit = int(params.get("start", 0)), int(params.get("limit", 25))
+        headers = {"Total-Results": len(items), "Last-Modified-Version": self.version}
+        req._respond(200, items[start:start + limit], headers=headers)
+
+    def _unchanged(self, req) -> bool:
+        since = req.headers.get("If-Modified-Since-Version")
+        if since is not None and int(since) >= self.version:
+            req._respond(304, headers={"Last-Modified-Version": self.version})
+            return True
+        return False
+
+    def handle(self, req, method, path, params):
+        parts = path.strip("/").split("/")
+        if len(parts) < 3 or parts[0] != "users":
+            return req._respond(404, {"error": f"Unknown Zotero path {path}"})
+        rest = parts[2:]
+        if method == "GET" and rest == ["collections"]:
+            if self._unchanged(req):
+                return
+            return self._page(req, self.collections, params)
+        if method == "GET" and rest == ["items"]:
+            if self._unchanged(req):
+                return
+            since = int(params.get("since", 0))
+            return self._page(req, [item for item in self.library if item["version"] > since], params)
+        if method == "GET" and rest == ["deleted"]:
+            return req._respond(200, {"items": [], "collections": []}, headers={"Last-Modified-Version": self.version})
+        if method == "GET" and len(rest) == 3 and rest[0] == "items" and rest[2] == "children":
+            children = [item for item in self.library if item["data"].get("parentItem") == rest[1]]
+            return req._respond(200, children)
+        if method == "GET" and len(rest) == 3 and rest[0] == "items" and rest[2] == "file":
+            return req._respond(200, self.pdf, content_type="application/pdf")
+        if method == "POST" and rest in (["collections"], ["items"]):
+            objects = params.get("_json", [])
+            with self._lock:
+                self.version += 1
+                successful = {}
+                for i, obj in enumerate(objects):
+                    key = f"N{self.version:04d}{i:03d}"
+                    entry = {"key": key, "version": self.version, "data": {**obj.get("data", obj), "key": key}}
+                    (self.collections if rest == ["collections"] else self.library).append(entry)
+                    successful[str(i)] = entry
+            return req._respond(200, {"successful": successful, "success": {}, "unchanged": {}, "failed": {}},
+                                headers={"Last-Modified-Version": self.version})
+        req._respond(404, {"error": f"Unknown Zotero path {path}"})
+
+class FakeUpstreams:
+    # Starts all three fakes; env() gives the settings that point the app at them
+    def __init__(self, latency: float = 0.05, pubmed_count: int = 2000, zotero_items: int = 200, pdf_pages: int = 30):
+        self.eutils = FakeEutils(latency, count=pubmed_count)
+        self.elsevier = FakeElsevier(latency)
+        self.zotero = FakeZotero(latency, items=zotero_items, pdf_pages=pdf_pages)
+
+    def __enter__(self):
+        for upstream in (self.eutils, self.elsevier, self.zotero):
+            upstream.start()
+        return self
+
+    def __exit__(self, *exc):
+        for upstream in (self.eutils, self.elsevier, self.zotero):
+            upstream.stop()
+
+    def env(self) -> dict:
+        return {
+            "PUBMED_EUTILS_BASE": f"{self.eutils.url}/entrez/eutils",
+            "ELSEVIER_API_BASE": self.elsevier.url,
+            "ZOTERO_API_BASE": self.zotero.url,
+        }
+
+    def request_counts(self) -> dict:
+        return {"pubmed": self.eutils.requests, "elsevier": self.elsevier.requests, "zotero": self.zotero.requests}
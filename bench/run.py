@@ -0,0 +1,208 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from bench.fake_upstreams import FakeUpstreams, id_base
+
+# Offline benchmark: starts the fake upstreams, runs the app under uvicorn
+# in a subprocess pointed at them, drives each scenario at the requested
+# concurrency and reports throughput, latency percentiles and peak RSS.
+#
+#   python -m bench.run --requests 40 --concurrency 8 --latency 0.05
+#
+# Every run uses a fresh CACHE_DIR unless --cache-dir is given, so results
+# are cold-cache numbers; rerun with the same --cache-dir for warm ones.
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+USER_ID, API_KEY = "bench", "bench-key"
+
+def litsearch_request(i: int, args):
+    return "GET", "/litsearch/search", {
+        "query": f"bench topic {i}",
+        "databases": ["pubmed", "scopus", "sciencedirect"],
+        "retmax": 20
+    }
+
+def pubmed_fetch_request(i: int, args):
+    return "GET", "/pubmed/fetch", {"query": f"bench fetch {i}", "retmax": args.fetch_size}
+
+def zotero_extract_request(i: int, args):
+    return "GET", "/zotero/zotero/extract_chunks_from_collection", {
+        "user_id": USER_ID,
+        "api_key": API_KEY,
+        "collection_name": "Bench",
+        "limit_items": args.extract_items,
+        "start_index": (i * args.extract_items) % args.zotero_items
+    }
+
+def zotero_add_request(i: int, args):
+    return "POST", "/zotero/add", {
+        "user_id": USER_ID,
+        "api_key": API_KEY,
+        "pmid": str(id_base("bench add") + i),
+        "collection_name": "Bench"
+    }
+
+SCENARIOS = {
+    "litsearch": litsearch_request,
+    "pubmed_fetch": pubmed_fetch_request,
+    "zotero_extract": zotero_extract_request,
+    "zotero_add": zotero_add_request,
+}
+
+def percentile(values: list, pct: float) -> float:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+def peak_rss_mb(pid: int) -> dict:
+    # VmHWM of the server and the largest of its child processes (the PDF
+    # extraction pool); Linux only
+    def hwm(p):
+        try:
+            with open(f"/proc/{p}/status") as f:
+                for line in f:
+                    if line.startswith("VmHWM:"):
+                        return int(line.split()[1]) / 1024
+        except OSError:
+            return None
+
+    def children(p):
+        try:
+            with open(f"/proc/{p}/task/{p}/children") as f:
+                return [int(c) for c in f.read().split()]
+        except OSError:
+            return []
+
+    workers = [hwm(c) for c in children(pid)]
+    workers = [w for w in workers if w is not None]
+    return {"server": hwm(pid), "largest_worker": max(workers) if workers else None}
+
+def run_scenario(base_url: str, name: str, args) -> dict:
+    local = threading.local()
+    latencies, errors = [], []
+
+    def one(i: int):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        method, path, params = SCENARIOS[name](i, args)
+        started = time.perf_counter()
+        try:
+            response = session.request(method, base_url + path, params=params, timeout=args.timeout)
+            # Several endpoints report failures as {"error": ...} with a 200
+            body = response.json() if response.headers.get("content-type", "").startswith("application/json") else None
+            if response.status_code >= 400 or (isinstance(body, dict) and "error" in body):
+                errors.append(f"{response.status_code}: {response.text[:200]}")
+        except Exception as e:
+            errors.append(str(e))
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        list(executor.map(one, range(args.requests)))
+    elapsed = time.perf_counter() - started
+
+    ms = [latency * 1000 for latency in latencies]
+    return {
+        "scenario": name,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(args.requests / elapsed, 2) if elapsed else None,
+        "p50_ms": round(percentile(ms, 50), 1),
+        "p90_ms": round(percentile(ms, 90), 1),
+        "p99_ms": round(percentile(ms, 99), 1),
+        "max_ms": round(max(ms), 1)
+    }
+
+def start_app(env: dict, port: int, verbose: bool = False, startup_timeout: float = 60) -> subprocess.Popen:
+    # App logs would drown the report; --verbose passes them through
+    output = None if verbose else subprocess.DEVNULL
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=REPO_ROOT, env=env, stdout=output, stderr=output
+    )
+    deadline = time.monotonic() + startup_timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"App exited during startup with code {process.returncode}")
+        try:
+            requests.get(f"http://127.0.0.1:{port}/metrics", timeout=1)
+            return process
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("App did not start in time")
+
+def print_table(results: list):
+    columns = ["scenario", "requests", "errors", "throughput_rps", "p50_ms", "p90_ms", "p99_ms", "max_ms", "peak_rss_mb"]
+    rows = [[str(r.get(c)) for c in columns] for r in results]
+    widths = [max(len(c), *(len(row[i]) for row in rows)) for i, c in enumerate(columns)]
+    print("  ".join(c.ljust(w) for c, w in zip(columns, widths)))
+    for row in rows:
+        print("  ".join(v.ljust(w) for v, w in zip(row, widths)))
+    for r in results:
+        if r["first_error"]:
+            print(f"{r['scenario']}: first error: {r['first_error']}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark against local fake upstreams")
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=40, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.05, help="added latency per upstream response (s)")
+    parser.add_argument("--pubmed-count", type=int, default=2000, help="hits per PubMed query")
+    parser.add_argument("--fetch-size", type=int, default=500, help="records per /pubmed/fetch request")
+    parser.add_argument("--zotero-items", type=int, default=200, help="articles in the Zotero collection")
+    parser.add_argument("--extract-items", type=int, default=5, help="articles per extraction request")
+    parser.add_argument("--pdf-pages", type=int, default=30)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--timeout", type=float, default=300, help="client timeout per request (s)")
+    parser.add_argument("--cache-dir", help="reuse this CACHE_DIR (warm caches) instead of a fresh one")
+    parser.add_argument("--rate-limits", action="store_true", help="keep the real per-upstream rate limits")
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--verbose", action="store_true", help="show the app's log output")
+    args = parser.parse_args()
+
+    cache_dir = args.cache_dir or tempfile.mkdtemp(prefix="littools-bench-")
+    with FakeUpstreams(args.latency, args.pubmed_count, args.zotero_items, args.pdf_pages) as fakes:
+        env = {**os.environ, **fakes.env(), "CACHE_DIR": cache_dir}
+        if not args.rate_limits:
+            # Measure the app, not the throttle
+            env.update({"PUBMED_RATE_LIMIT": "0", "ELSEVIER_RATE_LIMIT": "0", "ZOTERO_RATE_LIMIT": "0"})
+        process = start_app(env, args.port, args.verbose)
+        results = []
+        try:
+            for name in args.scenarios:
+                result = run_scenario(f"http://127.0.0.1:{args.port}", name, args)
+                rss = peak_rss_mb(process.pid)
+                result["peak_rss_mb"] = round(rss["server"], 1) if rss["server"] else None
+                result["peak_worker_rss_mb"] = round(rss["largest_worker"], 1) if rss["largest_worker"] else None
+                results.append(result)
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+            if not args.cache_dir:
+                shutil.rmtree(cache_dir, ignore_errors=True)
+        upstream_requests = fakes.request_counts()
+
+    print_table(results)
+    print(f"Upstream requests: {upstream_requests}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "results": results, "upstream_requests": upstream_requests}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+import os
+import json
+import time
+import logging
+from clients import metrics
+from clients.storage import SQLiteStore, cache_path
+
+# Set up basic logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Parsed PubMed records keyed by PMID. Entries older than ARTICLE_CACHE_TTL
+# seconds are ignored and purged; past ARTICLE_CACHE_MAX_ENTRIES the least
+# recently used records are evicted.
+ARTICLE_CACHE_TTL = int(os.getenv("ARTICLE_CACHE_TTL", str(30 * 24 * 3600)))
+ARTICLE_CACHE_MAX_ENTRIES = int(os.getenv("ARTICLE_CACHE_MAX_ENTRIES", "50000"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS articles (
+    pmid TEXT PRIMARY KEY,
+    record TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS articles_accessed_at ON articles (accessed_at);
+"""
+
+_store = SQLiteStore(cache_path("articles.sqlite3"), SCHEMA)
+
+# SQLite caps the number of bound parameters per statement
+_MAX_PARAMS = 500
+
+def get_articles(pmids: list[str]) -> dict:
+    now = time.time()
+    found = {}
+    unique = list(dict.fromkeys(pmids))
+    for i in range(0, len(unique), _MAX_PARAMS):
+        chunk = unique[i:i + _MAX_PARAMS]
+        placeholders = ",".join("?" * len(chunk))
+        with _store.transaction() as conn:
+            rows = conn.execute(
+                f"SELECT pmid, record FROM articles WHERE pmid IN ({placeholders}) AND fetched_at >= ?",
+                (*chunk, now - ARTICLE_CACHE_TTL)
+            ).fetchall()
+            conn.executemany(
+                "UPDATE articles SET accessed_at = ? WHERE pmid = ?",
+                [(now, row["pmid"]) for row in rows]
+            )
+        for row in rows:
+            found[row["pmid"]] = json.loads(row["record"])
+    metrics.record_cache("articles", hits=len(found), misses=len(unique) - len(found))
+    logger.debug(f"Article cache: {len(found)} hits, {len(unique) - len(found)} misses")
+    return found
+
+def put_articles(records: list[dict]):
+    records = [r for r in records if r.get("pmid")]
+    if not records:
+        return
+    now = time.time()
+    with _store.transaction() as conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO articles (pmid, record, fetched_at, accessed_at) VALUES (?, ?, ?, ?)",
+            [(r["pmid"], json.dumps(r), now, now) for r in records]
+        )
+    evict()
+
+def evict():
+    with _store.transaction() as conn:
+        expired = conn.execute(
+            "DELETE FROM articles WHERE fetched_at < ?", (time.time() - ARTICLE_CACHE_TTL,)
+        ).rowcount
+        overflow = conn.execute("SELECT COUNT(*) FROM articles").fetchone()[0] - ARTICLE_CACHE_MAX_ENTRIES
+        if overflow > 0:
+            conn.execute(
+                "DELETE FROM articles WHERE pmid IN "
+                "(SELECT pmid FROM articles ORDER BY accessed_at LIMIT ?)",
+                (overflow,)
+            )
+    if expired or overflow > 0:
+        logger.info(f"Article cache: purged {expired} expired, evicted {max(overflow, 0)} LRU records")
@@ -1,12 +1,26 @@
 import os
+import time
+import logging
+import threading
 import requests
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+from clients.http import http_get, http_put
+from clients.search_cache import cached_search
+from clients import metrics, search_index
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv(dotenv_path=".env")
 
+# Set up basic logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
 API_KEY = os.getenv("ELSEVIER_API_KEY")
-BASE_URL = "https://api.elsevier.com/content/search/scopus"
+ELSEVIER_API_BASE = os.getenv("ELSEVIER_API_BASE", "https://api.elsevier.com")
+BASE_URL = f"{ELSEVIER_API_BASE}/content/search/scopus"
 
 def search_scopus(query: str, count: int = 10, start: int = 0):
     headers = {
@@ -18,15 +32,24 @@ def search_scopus(query: str, count: int = 10, start: int = 0):
         "count": count,
         "start": start
     }
-    response = requests.get(BASE_URL, headers=headers, params=params)
+    response = http_get("elsevier", BASE_URL, headers=headers, params=params)
     response.raise_for_status()
     return parse_scopus_results(response.json())
 
+def cached_search_scopus(query: str, count: int = 10, start: int = 0):
+    return cached_search(
+        "scopus", lambda: search_scopus(query, count=count, start=start),
+        query=query, count=count, start=start
+    )
+
 def parse_scopus_results(data):
     entries = data.get("search-results", {}).get("entry", [])
     parsed = []
 
     for entry in entries:
+        if "error" in entry:
+            # Scopus reports an empty result set as a single error entry
+            continue
         parsed.append({
             "source": "scopus",
             "title": entry.get("dc:title"),
@@ -44,75 +67,126 @@ def parse_scopus_results(data):
 
     return parsed
 
-def fetch_full_text_by_doi(doi: str, para_start: int = 1, para_end: int = None):
+# Split full-text paragraphs cached per DOI so paragraph ranges of the same
+# article are served without downloading it again. Entries expire after
+# FULLTEXT_CACHE_TTL seconds; least recently used articles are dropped once
+# FULLTEXT_CACHE_MAX_BYTES of text is held.
+FULLTEXT_CACHE_TTL = float(os.getenv("FULLTEXT_CACHE_TTL", str(24 * 3600)))
+FULLTEXT_CACHE_MAX_BYTES = int(os.getenv("FULLTEXT_CACHE_MAX_BYTES", str(256 * 1024 ** 2)))
+
+_fulltext_cache: OrderedDict = OrderedDict()
+_fulltext_cache_bytes = 0
+_fulltext_lock = threading.Lock()
+
+def _cache_paragraphs(doi: str, paragraphs: list[str]):
+    global _fulltext_cache_bytes
+    size = sum(len(p) for p in paragraphs)
+    if size > FULLTEXT_CACHE_MAX_BYTES:
+        return
+    with _fulltext_lock:
+        if doi in _fulltext_cache:
+            _fulltext_cache_bytes -= _fulltext_cache.pop(doi)[2]
+        _fulltext_cache[doi] = (paragraphs, time.monotonic(), size)
+        _fulltext_cache_bytes += size
+        while _fulltext_cache_bytes > FULLTEXT_CACHE_MAX_BYTES:
+            _, (_, _, evicted) = _fulltext_cache.popitem(last=False)
+            _fulltext_cache_bytes -= evicted
+
+def _cached_paragraphs(doi: str):
+    global _fulltext_cache_bytes
+    with _fulltext_lock:
+        entry = _fulltext_cache.get(doi)
+        if entry is None:
+            return None
+        if time.monotonic() - entry[1] > FULLTEXT_CACHE_TTL:
+            _fulltext_cache_bytes -= _fulltext_cache.pop(doi)[2]
+            return None
+        _fulltext_cache.move_to_end(doi)
+        return entry[0]
+
+def fetch_full_text_paragraphs(doi: str):
+    paragraphs = _cached_paragraphs(doi)
+    if paragraphs is not None:
+        metrics.record_cache("fulltext", hits=1)
+        return paragraphs
+    metrics.record_cache("fulltext", misses=1)
+
     headers = {
         "X-ELS-APIKey": API_KEY,
         "Accept": "application/json"
     }
-    url = f"https://api.elsevier.com/content/article/doi/{doi}"
-
-    try:
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        data = response.json()
-
-        original_text = data.get("full-text-retrieval-response", {}).get("originalText", "")
-        if not original_text:
-            return {"error": "Full text not available. This may be due to access restrictions."}
-
-        # Split into chunks by paragraph (or double line break)
-        paragraphs = [p.strip() for p in original_text.split("\n\n") if p.strip()]
-        total_paragraphs = len(paragraphs)
+    url = f"{ELSEVIER_API_BASE}/content/article/doi/{doi}"
+    # Full texts are large; a transient failure is retried once, not
+    # MAX_RETRIES times
+    response = http_get("elsevier", url, headers=headers, retries=1)
+    response.raise_for_status()
+    data = response.json()
 
-        start = max(para_start - 1, 0)
-        end = min(para_end, total_paragraphs) if para_end else total_paragraphs
-        selected = paragraphs[start:end]
+    original_text = data.get("full-text-retrieval-response", {}).get("originalText", "")
+    # Split into chunks by paragraph (or double line break)
+    paragraphs = [p.strip() for p in (original_text or "").split("\n\n") if p.strip()]
+    _cache_paragraphs(doi, paragraphs)
+    search_index.index_elsevier_full_text(doi, paragraphs)
+    return paragraphs
 
+def fetch_full_text_by_doi(doi: str, para_start: int = 1, para_end: int = None):
+    try:
+        paragraphs = fetch_full_text_paragraphs(doi)
+    except requests.HTTPError as e:
         return {
             "doi": doi,
-            "total_paragraphs": total_paragraphs,
-            "range": [start + 1, end],
-            "paragraphs": selected
+            "error": "Elsevier returned an error for the full text request.",
+            "status": e.response.status_code,
+            "reason": e.response.reason,
+            "error_detail": str(e)
         }
-
-    except Exception as e:
-        # Handle large response error or other issues
-        fallback_response = {
+    except (requests.RequestException, ValueError) as e:
+        # No usable response: connection failure, timeout, open circuit or
+        # a body that is not JSON
+        return {
             "doi": doi,
-            "warning": "Full text may be too large to retrieve in one request.",
-            "suggestion": "Try using smaller ranges with para_start and para_end (e.g., 1–5).",
+            "error": "Full text request failed.",
+            "status": None,
+            "reason": type(e).__name__,
             "error_detail": str(e)
         }
 
-        # Attempt to return just the first paragraph if possible
-        try:
-            response = requests.get(url, headers=headers)
-            response.raise_for_status()
-            data = response.json()
-            original_text = data.get("full-text-retrieval-response", {}).get("originalText", "")
-            paragraphs = [p.strip() for p in original_text.split("\n\n") if p.strip()]
-            if paragraphs:
-                fallback_response["first_paragraph"] = paragraphs[0]
-        except:
-            fallback_response["first_paragraph"] = None
-
-        return fallback_response
-        
+    if not paragraphs:
+        return {"error": "Full text not available. This may be due to access restrictions."}
+
+    total_paragraphs = len(paragraphs)
+    start = max(para_start - 1, 0)
+    end = min(para_end, total_paragraphs) if para_end else total_paragraphs
+    selected = paragraphs[start:end]
+
+    return {
+        "doi": doi,
+        "total_paragraphs": total_paragraphs,
+        "range": [start + 1, end],
+        "paragraphs": selected
+    }
+
 def search_sciencedirect(query: str, count: int = 10, start: int = 0):
     headers = {
         "X-ELS-APIKey": API_KEY,
         "Accept": "application/json"
     }
-    url = "https://api.elsevier.com/content/search/sciencedirect"
+    url = f"{ELSEVIER_API_BASE}/content/search/sciencedirect"
     params = {
         "query": query,
         "count": count,
         "start": start
     }
-    response = requests.get(url, headers=headers, params=params)
+    response = http_get("elsevier", url, headers=headers, params=params)
     response.raise_for_status()
     return parse_sciencedirect_results(response.json())
 
+def cached_search_sciencedirect(query: str, count: int = 10, start: int = 0):
+    return cached_search(
+        "sciencedirect", lambda: search_sciencedirect(query, count=count, start=start),
+        query=query, count=count, start=start
+    )
+
 def parse_sciencedirect_results(data):
     entries = data.get("search-results", {}).get("entry", [])
     parsed = []
@@ -131,4 +205,104 @@ def parse_sciencedirect_results(data):
             "link_to_fulltext": next((link["@href"] for link in entry.get("link", []) if link.get("@ref") == "full-text"), None)
         })
 
-    return parsed
\ No newline at end of file
+    return parsed
+
+# Deep retrieval. Scopus pages with cursor=* (offset paging stops at 5,000
+# results); ScienceDirect uses the PUT search API and its offset. Every page
+# comes with a token that resumes the walk, and the next page is requested
+# while the current one is being consumed.
+SCOPUS_DEEP_PAGE_SIZE = int(os.getenv("SCOPUS_DEEP_PAGE_SIZE", "25"))
+SCIENCEDIRECT_DEEP_PAGE_SIZE = 100  # ScienceDirect's maximum "show" value
+SCIENCEDIRECT_MAX_OFFSET = 6000
+
+_prefetch_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="elsevier-prefetch")
+
+def fetch_scopus_cursor_page(query: str, cursor: str = "*", count: int = SCOPUS_DEEP_PAGE_SIZE):
+    # Returns (records, next_cursor, total_results)
+    headers = {
+        "X-ELS-APIKey": API_KEY,
+        "Accept": "application/json"
+    }
+    params = {
+        "query": query,
+        "count": count,
+        "cursor": cursor
+    }
+    response = http_get("elsevier", BASE_URL, headers=headers, params=params)
+    response.raise_for_status()
+    data = response.json()
+    results = data.get("search-results", {})
+    next_cursor = results.get("cursor", {}).get("@next")
+    records = parse_scopus_results(data)
+    if not records or next_cursor == cursor:
+        next_cursor = None
+    return records, next_cursor, int(results.get("opensearch:totalResults") or 0)
+
+def parse_sciencedirect_put_results(data):
+    parsed = []
+    for result in data.get("results", []):
+        parsed.append({
+            "source": "sciencedirect",
+            "title": result.get("title"),
+            "doi": result.get("doi"),
+            "authors": ", ".join(a.get("name", "") for a in result.get("authors") or []),
+            "journal": result.get("sourceTitle"),
+            "publication_date": result.get("publicationDate"),
+            "url": result.get("uri"),
+            "pii": result.get("pii"),
+            "openaccess": result.get("openAccess"),
+            "link_to_fulltext": result.get("uri")
+        })
+    return parsed
+
+def fetch_sciencedirect_put_page(query: str, offset: str = "0", show: int = SCIENCEDIRECT_DEEP_PAGE_SIZE):
+    # Returns (records, next_offset, total_results); offsets travel as
+    # strings so they can be used as resume tokens like Scopus cursors
+    headers = {
+        "X-ELS-APIKey": API_KEY,
+        "Accept": "application/json",
+        "Content-Type": "application/json"
+    }
+    offset = int(offset)
+    body = {"qs": query, "display": {"offset": offset, "show": show}}
+    response = http_put("elsevier", f"{ELSEVIER_API_BASE}/content/search/sciencedirect", headers=headers, json=body)
+    response.raise_for_status()
+    data = response.json()
+    records = parse_sciencedirect_put_results(data)
+    total = int(data.get("resultsFound") or 0)
+    next_offset = offset + len(records)
+    has_more = records and next_offset < min(total, SCIENCEDIRECT_MAX_OFFSET)
+    return records, str(next_offset) if has_more else None, total
+
+def check_deep_token(source: str, token: Optional[str]):
+    # Raises ValueError for a resume token the source could not have issued
+    if token is None:
+        return
+    if not token.strip():
+        raise ValueError("cursor must not be empty")
+    if source == "sciencedirect" and not (token.isdigit() and int(token) < SCIENCEDIRECT_MAX_OFFSET):
+        raise ValueError(f"ScienceDirect cursor must be an offset from 0 to {SCIENCEDIRECT_MAX_OFFSET - 1}")
+
+DEEP_PAGE_FETCHERS = {
+    "scopus": (fetch_scopus_cursor_page, "*"),
+    "sciencedirect": (fetch_sciencedirect_put_page, "0"),
+}
+
+def iter_deep_search(source: str, query: str, token: str = None, max_records: int = None):
+    # Yields (records, next_token, total_results) page by page; next_token is
+    # None on the last page. The following page is already in flight while the
+    # caller handles the current one.
+    fetch_page, first_token = DEEP_PAGE_FETCHERS[source]
+    future = _prefetch_executor.submit(fetch_page, query, token or first_token)
+    returned = 0
+    try:
+        while future is not None:
+            records, next_token, total = future.result()
+            if max_records is not None and returned + len(records) >= max_records:
+                records, next_token = records[:max_records - returned], None
+            returned += len(records)
+            future = _prefetch_executor.submit(fetch_page, query, next_token) if next_token else None
+            yield records, next_token, total
+    finally:
+        if future is not None:
+            future.cancel()
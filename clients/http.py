@@ -0,0 +1,226 @@
+import time
+import threading
+import logging
+import contextvars
+import requests
+from contextlib import contextmanager
+from requests.adapters import HTTPAdapter
+from clients import metrics, throttle
+
+# Set up basic logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# One pooled, keep-alive session per upstream host. Pool sizes and timeouts
+# default to HTTP_* and can be overridden per upstream, e.g. ZOTERO_POOL_MAXSIZE.
+UPSTREAMS = {
+    "pubmed": "https://eutils.ncbi.nlm.nih.gov",
+    "elsevier": "https://api.elsevier.com",
+    "zotero": "https://api.zotero.org",
+}
+
+_setting = throttle.setting
+
+def pool_config(upstream: str) -> dict:
+    return {
+        "pool_connections": int(_setting(upstream, "POOL_CONNECTIONS", "4")),
+        "pool_maxsize": int(_setting(upstream, "POOL_MAXSIZE", "20")),
+        "connect_timeout": _setting(upstream, "CONNECT_TIMEOUT", "5"),
+        "read_timeout": _setting(upstream, "READ_TIMEOUT", "60"),
+    }
+
+_sessions: dict[str, requests.Session] = {}
+_lock = threading.Lock()
+
+def _create_session(upstream: str) -> requests.Session:
+    config = pool_config(upstream)
+    adapter = HTTPAdapter(
+        pool_connections=config["pool_connections"],
+        pool_maxsize=config["pool_maxsize"],
+        # requests has no pool timeout, so a blocking pool could hold a caller
+        # forever. Concurrency is already bounded by the worker pools and
+        # token buckets; past pool_maxsize an extra connection is opened and
+        # closed after use instead of waiting.
+        pool_block=False
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    logger.info(
+        f"Opened HTTP pool for {upstream}: maxsize={config['pool_maxsize']}, "
+        f"timeouts=({config['connect_timeout']}, {config['read_timeout']})"
+    )
+    return session
+
+def get_session(upstream: str) -> requests.Session:
+    session = _sessions.get(upstream)
+    if session is None:
+        with _lock:
+            session = _sessions.get(upstream)
+            if session is None:
+                session = _sessions[upstream] = _create_session(upstream)
+    return session
+
+def open_sessions():
+    for upstream in UPSTREAMS:
+        get_session(upstream)
+
+def close_sessions():
+    with _lock:
+        for upstream, session in _sessions.items():
+            session.close()
+            logger.info(f"Closed HTTP pool for {upstream}")
+        _sessions.clear()
+
+# Optional caller deadline (time.monotonic() value) for every call made in
+# the current context; see deadline(). Context variables do not follow work
+# handed to another thread, so pass it on with contextvars.copy_context().
+_deadline = contextvars.ContextVar("upstream_deadline", default=None)
+
+class DeadlineExceeded(requests.Timeout):
+    # Raised instead of starting (or retrying) a call once the caller's
+    # deadline has passed
+    pass
+
+@contextmanager
+def deadline(seconds: float):
+    # Caps the timeouts and retries of every upstream call made inside the
+    # block so none of them outlives the caller's own deadline
+    token = _deadline.set(time.monotonic() + max(0.0, seconds))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+def time_left():
+    # Seconds until the current deadline, or None without one
+    at = _deadline.get()
+    return None if at is None else at - time.monotonic()
+
+def check_deadline():
+    left = time_left()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded("Deadline exceeded before the upstream call finished")
+
+def _bounded_timeout(timeout):
+    left = time_left()
+    if left is None or timeout is None:
+        return timeout if left is None else left
+    if isinstance(timeout, tuple):
+        return tuple(min(t, left) if t is not None else left for t in timeout)
+    return min(timeout, left)
+
+def _may_retry(delay: float) -> bool:
+    left = time_left()
+    return left is None or delay < left
+
+def request(
+    upstream: str,
+    method: str,
+    url: str,
+    idempotent: bool = None,
+    retries: int = None,
+    **kwargs
+) -> requests.Response:
+    # Every call is rate limited, retried on transient failures and guarded by
+    # the upstream's circuit breaker (see clients.throttle). Non-idempotent
+    # calls are only resent when the server rejected them (429/503) or the
+    # connection was never made; pass idempotent=True for read-only POSTs.
+    # retries caps the resends for this call below {UPSTREAM}_MAX_RETRIES.
+    # Inside deadline() timeouts shrink to the time left and no retry is made
+    # that could not finish in time; a call cut short that way raises
+    # DeadlineExceeded and does not count against the circuit breaker.
+    timeout = kwargs.pop("timeout", None)
+    if timeout is None:
+        config = pool_config(upstream)
+        timeout = (config["connect_timeout"], config["read_timeout"])
+    if idempotent is None:
+        idempotent = method.upper() in ("GET", "HEAD", "PUT", "DELETE", "OPTIONS")
+    bucket = throttle.bucket_for(upstream, throttle.api_key_of(upstream, kwargs))
+    breaker = throttle.breaker_for(upstream)
+    max_retries = int(_setting(upstream, "MAX_RETRIES", "3"))
+    retries = max_retries if retries is None else min(retries, max_retries)
+    session = get_session(upstream)
+
+    # The breaker sees one outcome per call, not per attempt: a call that
+    # exhausts its retries counts as a single failure, and a call that took
+    # the half-open trial keeps it through its own retries.
+    trial = False
+    try:
+        for attempt in range(retries + 1):
+            check_deadline()
+            if not trial and breaker.state == "open":
+                # Fail fast without spending a token
+                breaker.before_call()
+            bucket.acquire()
+            # Checked before before_call(), which may take the half-open trial
+            check_deadline()
+            if not trial:
+                trial = breaker.before_call()
+            bounded = _bounded_timeout(timeout)
+            started = time.perf_counter()
+            try:
+                response = session.request(method, url, timeout=bounded, **kwargs)
+            except Exception as e:
+                metrics.UPSTREAM_REQUEST_SECONDS.observe(
+                    time.perf_counter() - started, upstream=upstream, method=method, status="error"
+                )
+                if isinstance(e, requests.Timeout) and bounded != timeout:
+                    # Only the caller's deadline was too short, not the upstream
+                    raise DeadlineExceeded(f"{upstream} {method} cut short by the caller's deadline") from e
+                # A connect timeout never reached the server, so any call may be resent
+                retryable = isinstance(e, requests.ConnectTimeout) or (
+                    idempotent and isinstance(e, (requests.ConnectionError, requests.Timeout))
+                )
+                delay = throttle.backoff_delay(upstream, attempt)
+                if not retryable or attempt >= retries or not _may_retry(delay):
+                    trial = False
+                    breaker.record_failure()
+                    raise
+                logger.warning(f"{upstream} {method} failed ({e}); retry {attempt + 1}/{retries} in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+
+            status = response.status_code
+            # Streamed bodies are counted by the caller as they are read
+            metrics.UPSTREAM_REQUEST_SECONDS.observe(
+                time.perf_counter() - started, upstream=upstream, method=method, status=status
+            )
+            if not kwargs.get("stream"):
+                metrics.UPSTREAM_BYTES.inc(len(response.content), upstream=upstream)
+            throttle.observe(upstream, bucket, response)
+            if status < 500:
+                trial = False
+                breaker.record_success()
+            if status == 429:
+                bucket.slow_down()
+            elif status < 400:
+                bucket.recover()
+
+            retryable = status in throttle.RETRY_STATUSES and (idempotent or status in throttle.REJECTED_STATUSES)
+            delay = throttle.backoff_delay(upstream, attempt, response) if retryable and attempt < retries else None
+            if delay is None or not _may_retry(delay):
+                if status >= 500:
+                    trial = False
+                    breaker.record_failure()
+                return response
+            if status == 429:
+                # Hold back every caller sharing this bucket, not just this one
+                bucket.pause(delay)
+            logger.warning(f"{upstream} {method} returned {status}; retry {attempt + 1}/{retries} in {delay:.1f}s")
+            response.close()
+            time.sleep(delay)
+    except BaseException:
+        # Ended without an outcome (deadline, interrupted); free the trial
+        if trial:
+            breaker.release_trial()
+        raise
+
+def http_get(upstream: str, url: str, **kwargs) -> requests.Response:
+    return request(upstream, "GET", url, **kwargs)
+
+def http_post(upstream: str, url: str, **kwargs) -> requests.Response:
+    return request(upstream, "POST", url, **kwargs)
+
+def http_put(upstream: str, url: str, **kwargs) -> requests.Response:
+    return request(upstream, "PUT", url, **kwargs)
@@ -0,0 +1,139 @@
+import time
+import threading
+from contextlib import contextmanager
+
+# In-process metrics rendered in the Prometheus text format (served on
+# /metrics). Counters and histograms are keyed by label values; gauges are
+# read from callbacks at scrape time so they never go stale.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_metrics: list = []
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(names: tuple, values: tuple) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+def _format(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name, self.help, self.label_names = name, help, labels
+        self._values = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels.get(n, "") for n in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.label_names, key)} {_format(value)}")
+        return lines
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name, self.help, self.label_names = name, help, labels
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(n, "") for n in self.label_names)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        names = self.label_names + ("le",)
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                for bound, n in zip(self.buckets, counts):
+                    lines.append(f"{self.name}_bucket{_labels(names, key + (_format(bound),))} {n}")
+                lines.append(f"{self.name}_bucket{_labels(names, key + ('+Inf',))} {count}")
+                lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {_format(total)}")
+                lines.append(f"{self.name}_count{_labels(self.label_names, key)} {count}")
+        return lines
+
+class Gauge:
+    # callback() returns {label values tuple: value}, or a number when the
+    # gauge has no labels
+    def __init__(self, name: str, help: str, callback, labels: tuple = ()):
+        self.name, self.help, self.label_names = name, help, labels
+        self.callback = callback
+        _metrics.append(self)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        values = self.callback()
+        if not isinstance(values, dict):
+            values = {(): values}
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{_labels(self.label_names, key)} {_format(value)}")
+        return lines
+
+def render() -> str:
+    lines = []
+    for metric in _metrics:
+        try:
+            lines.extend(metric.render())
+        except Exception as e:
+            # A failing gauge callback must not take the whole scrape down
+            lines.append(f"# {metric.name} unavailable: {e}")
+    return "\n".join(lines) + "\n"
+
+# Shared metrics; each module records its own
+HTTP_REQUEST_SECONDS = Histogram(
+    "littools_http_request_seconds", "API request latency by endpoint (streams: time to first byte)",
+    ("method", "endpoint", "status")
+)
+UPSTREAM_REQUEST_SECONDS = Histogram(
+    "littools_upstream_request_seconds", "Latency of calls to upstream APIs",
+    ("upstream", "method", "status")
+)
+UPSTREAM_BYTES = Counter(
+    "littools_upstream_bytes_total", "Response bytes downloaded from upstream APIs", ("upstream",)
+)
+CACHE_REQUESTS = Counter(
+    "littools_cache_requests_total", "Cache lookups by cache and result (hit, stale, miss)", ("cache", "result")
+)
+PDF_PAGES_EXTRACTED = Counter(
+    "littools_pdf_pages_extracted_total", "PDF pages run through PyMuPDF"
+)
+PDF_EXTRACTION_SECONDS = Histogram(
+    "littools_pdf_extraction_seconds", "Wall time of one PDF extraction on the process pool"
+)
+
+def record_cache(cache: str, hits: int = 0, misses: int = 0, stale: int = 0):
+    if hits:
+        CACHE_REQUESTS.inc(hits, cache=cache, result="hit")
+    if misses:
+        CACHE_REQUESTS.inc(misses, cache=cache, result="miss")
+    if stale:
+        CACHE_REQUESTS.inc(stale, cache=cache, result="stale")
@@ -0,0 +1,146 @@
+import os
+import json
+import time
+import logging
+from typing import Optional
+from importlib.metadata import version, PackageNotFoundError
+from clients.storage import SQLiteStore, cache_path
+
+# Set up basic logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Extracted text per (document, page). Rows record the extractor version, so
+# upgrading PyMuPDF makes old rows invisible and they are purged on the next
+# write. Pages extracted for section chunking also keep their styled lines
+# (zotero.pdf_text.section_lines) so chunking stored pages matches chunking
+# a fresh extraction. Storing a new version of an attachment's file drops the
+# old version's pages, and least recently used documents are removed once
+# PAGE_TEXT_MAX_BYTES of text is stored.
+PAGE_TEXT_MAX_BYTES = int(os.getenv("PAGE_TEXT_MAX_BYTES", str(512 * 1024 ** 2)))
+
+try:
+    EXTRACTOR_VERSION = f"pymupdf-{version('PyMuPDF')}"
+except PackageNotFoundError:
+    EXTRACTOR_VERSION = "pymupdf-unknown"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    doc_key TEXT PRIMARY KEY,
+    attachment_key TEXT,
+    extractor TEXT NOT NULL,
+    page_count INTEGER NOT NULL,
+    size INTEGER NOT NULL DEFAULT 0,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS documents_accessed_at ON documents (accessed_at);
+CREATE INDEX IF NOT EXISTS documents_attachment ON documents (attachment_key);
+CREATE TABLE IF NOT EXISTS pages (
+    doc_key TEXT NOT NULL,
+    page INTEGER NOT NULL,
+    extractor TEXT NOT NULL,
+    text TEXT NOT NULL,
+    lines TEXT,
+    PRIMARY KEY (doc_key, page)
+);
+"""
+
+# page_text.sqlite3 predates the lines column; it is only a cache
+for _suffix in ("", "-wal", "-shm"):
+    if os.path.exists(cache_path("page_text.sqlite3" + _suffix)):
+        os.remove(cache_path("page_text.sqlite3" + _suffix))
+_store = SQLiteStore(cache_path("page_text.v2.sqlite3"), SCHEMA)
+_purged = False
+
+def get_page_count(doc_key: str) -> Optional[int]:
+    rows = _store.query(
+        "SELECT page_count FROM documents WHERE doc_key = ? AND extractor = ?",
+        (doc_key, EXTRACTOR_VERSION)
+    )
+    return rows[0]["page_count"] if rows else None
+
+def get_page_range(doc_key: str, page_start: int = 1, page_end: int = None, with_lines: bool = False) -> Optional[dict]:
+    # Same shape as pdf_text.extract_pdf_pages, or None unless every page in
+    # the (clamped) range is stored. with_lines adds "lines" and also needs
+    # every page to have been stored with them.
+    page_count = get_page_count(doc_key)
+    if page_count is None:
+        return None
+    first = max(1, page_start)
+    last = min(page_end or page_count, page_count)
+    rows = _store.query(
+        "SELECT page, text, lines FROM pages WHERE doc_key = ? AND extractor = ? AND page BETWEEN ? AND ? ORDER BY page",
+        (doc_key, EXTRACTOR_VERSION, first, last)
+    )
+    if len(rows) != max(0, last - first + 1):
+        return None
+    _store.execute("UPDATE documents SET accessed_at = ? WHERE doc_key = ?", (time.time(), doc_key))
+    stored = {"page_count": page_count, "page_range": [first, last], "pages": [row["text"] for row in rows]}
+    if with_lines:
+        if any(row["lines"] is None for row in rows):
+            return None
+        stored["lines"] = [json.loads(row["lines"]) for row in rows]
+    return stored
+
+def put_pages(
+    doc_key: str,
+    page_count: int,
+    first_page: int,
+    pages: list[str],
+    lines: list = None,
+    attachment_key: str = None
+):
+    global _purged
+    with _store.transaction() as conn:
+        if not _purged:
+            stale = conn.execute("DELETE FROM pages WHERE extractor != ?", (EXTRACTOR_VERSION,)).rowcount
+            conn.execute("DELETE FROM documents WHERE extractor != ?", (EXTRACTOR_VERSION,))
+            if stale:
+                logger.info(f"Page text store: purged {stale} pages from older extractors")
+            _purged = True
+        if attachment_key:
+            # Pages of the attachment's previous file versions
+            old = [row["doc_key"] for row in conn.execute(
+                "SELECT doc_key FROM documents WHERE attachment_key = ? AND doc_key != ?", (attachment_key, doc_key)
+            )]
+            conn.executemany("DELETE FROM pages WHERE doc_key = ?", [(key,) for key in old])
+            conn.executemany("DELETE FROM documents WHERE doc_key = ?", [(key,) for key in old])
+        conn.execute(
+            "INSERT INTO documents (doc_key, attachment_key, extractor, page_count, accessed_at) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (doc_key) DO UPDATE SET attachment_key = COALESCE(excluded.attachment_key, attachment_key), "
+            "extractor = excluded.extractor, page_count = excluded.page_count, accessed_at = excluded.accessed_at",
+            (doc_key, attachment_key, EXTRACTOR_VERSION, page_count, time.time())
+        )
+        conn.executemany(
+            # A plain extraction (no lines) keeps lines stored earlier by the same extractor
+            "INSERT INTO pages (doc_key, page, extractor, text, lines) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (doc_key, page) DO UPDATE SET text = excluded.text, lines = CASE "
+            "WHEN excluded.lines IS NOT NULL THEN excluded.lines "
+            "WHEN pages.extractor = excluded.extractor THEN pages.lines END, extractor = excluded.extractor",
+            [
+                (doc_key, first_page + i, EXTRACTOR_VERSION, text, json.dumps(lines[i]) if lines else None)
+                for i, text in enumerate(pages)
+            ]
+        )
+        conn.execute(
+            "UPDATE documents SET size = (SELECT COALESCE(SUM(LENGTH(CAST(text AS BLOB)) + COALESCE(LENGTH(lines), 0)), 0) "
+            "FROM pages WHERE pages.doc_key = documents.doc_key) WHERE doc_key = ?",
+            (doc_key,)
+        )
+    evict()
+
+def evict(max_bytes: int = PAGE_TEXT_MAX_BYTES):
+    # Same policy as pdf_cache.evict, per document
+    with _store.transaction() as conn:
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM documents").fetchone()[0]
+        if total <= max_bytes:
+            return
+        victims = []
+        for row in conn.execute("SELECT doc_key, size FROM documents ORDER BY accessed_at"):
+            if total <= max_bytes:
+                break
+            victims.append(row["doc_key"])
+            total -= row["size"]
+        conn.executemany("DELETE FROM pages WHERE doc_key = ?", [(key,) for key in victims])
+        conn.executemany("DELETE FROM documents WHERE doc_key = ?", [(key,) for key in victims])
+    logger.info(f"Page text store: evicted {len(victims)} documents, {total} bytes remain")
@@ -0,0 +1,83 @@
+import os
+import re
+import time
+import uuid
+import logging
+from typing import Optional
+from clients.storage import CACHE_DIR, SQLiteStore, cache_path
+
+# Set up basic logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Downloaded attachment files, named by attachment key plus the md5 (or
+# mtime) Zotero reports for the file, so a changed file gets a new entry.
+# Least recently used files are removed once PDF_CACHE_MAX_BYTES is exceeded.
+PDF_CACHE_MAX_BYTES = int(os.getenv("PDF_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+PDF_CACHE_DIR = os.path.join(CACHE_DIR, "pdfs")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pdfs (
+    name TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS pdfs_accessed_at ON pdfs (accessed_at);
+"""
+
+_store = SQLiteStore(cache_path("pdf_cache.sqlite3"), SCHEMA)
+
+def cache_key(attachment: dict) -> Optional[str]:
+    data = attachment.get("data", {})
+    version = data.get("md5") or data.get("mtime")
+    if not data.get("key") or not version:
+        return None
+    return re.sub(r"[^A-Za-z0-9_-]", "_", f"{data['key']}-{version}")
+
+def _path(key: str) -> str:
+    return os.path.join(PDF_CACHE_DIR, f"{key}.pdf")
+
+def get_pdf_path(key: str) -> Optional[str]:
+    path = _path(key)
+    if not os.path.exists(path):
+        _store.execute("DELETE FROM pdfs WHERE name = ?", (key,))
+        return None
+    _store.execute("UPDATE pdfs SET accessed_at = ? WHERE name = ?", (time.time(), key))
+    return path
+
+def temp_path(key: str) -> str:
+    # Downloads are written here first so readers never see a partial file;
+    # same directory as the cache so commit_pdf is an atomic rename
+    os.makedirs(PDF_CACHE_DIR, exist_ok=True)
+    return os.path.join(PDF_CACHE_DIR, f"{key}.{uuid.uuid4().hex}.tmp")
+
+def commit_pdf(key: str, tmp_path: str) -> str:
+    path = _path(key)
+    size = os.path.getsize(tmp_path)
+    os.replace(tmp_path, path)
+    _store.execute(
+        "INSERT OR REPLACE INTO pdfs (name, size, accessed_at) VALUES (?, ?, ?)",
+        (key, size, time.time())
+    )
+    evict()
+    return path
+
+def evict(max_bytes: int = PDF_CACHE_MAX_BYTES):
+    with _store.transaction() as conn:
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM pdfs").fetchone()[0]
+        if total <= max_bytes:
+            return
+        victims = []
+        for row in conn.execute("SELECT name, size FROM pdfs ORDER BY accessed_at"):
+            if total <= max_bytes:
+                break
+            victims.append(row["name"])
+            total -= row["size"]
+        conn.executemany("DELETE FROM pdfs WHERE name = ?", [(name,) for name in victims])
+
+    for name in victims:
+        try:
+            os.remove(_path(name))
+        except FileNotFoundError:
+            pass
+    logger.info(f"PDF cache: evicted {len(victims)} files, {total} bytes remain")
@@ -1,12 +1,28 @@
-import requests
+from clients.http import http_get, http_post, check_deadline
+from clients import article_cache, metrics, search_index
+from clients.search_cache import cached_search
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
 import xml.etree.ElementTree as ET
+import contextvars
+import os
 import logging
 
 # Set up basic logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-PUBMED_EUTILS_BASE = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils"
+PUBMED_EUTILS_BASE = os.getenv("PUBMED_EUTILS_BASE", "https://eutils.ncbi.nlm.nih.gov/entrez/eutils")
+# With an NCBI API key E-utilities allow 10 instead of 3 requests per second
+NCBI_API_KEY = os.getenv("NCBI_API_KEY")
+
+def _eutils_params(params: dict) -> dict:
+    return {**params, "api_key": NCBI_API_KEY} if NCBI_API_KEY else params
+
+# Batch retrieval through the E-utilities History server: records are pulled
+# in chunks of BATCH_SIZE with at most BATCH_WORKERS chunks in flight.
+BATCH_SIZE = int(os.getenv("PUBMED_BATCH_SIZE", "500"))
+BATCH_WORKERS = int(os.getenv("PUBMED_BATCH_WORKERS", "3"))
 
 def search_pubmed(query: str, retmax: int = 10):
     url = f"{PUBMED_EUTILS_BASE}/esearch.fcgi"
@@ -16,45 +32,297 @@ def search_pubmed(query: str, retmax: int = 10):
         "retmode": "json",
         "retmax": retmax
     }
-    response = requests.get(url, params=params)
+    response = http_get("pubmed", url, params=_eutils_params(params))
     response.raise_for_status()
     id_list = response.json()["esearchresult"]["idlist"]
     logger.info(f"PubMed search: query='{query}', retmax={retmax}, results={len(id_list)}")
     return id_list
 
-def fetch_pubmed_details(pmids: list[str]):
-    url = f"{PUBMED_EUTILS_BASE}/efetch.fcgi"
+def cached_search_pubmed(query: str, retmax: int = 10):
+    return cached_search("pubmed", lambda: search_pubmed(query, retmax), query=query, retmax=retmax)
+
+def search_pubmed_history(query: str):
+    url = f"{PUBMED_EUTILS_BASE}/esearch.fcgi"
     params = {
         "db": "pubmed",
-        "id": ",".join(pmids),
-        "retmode": "xml"
+        "term": query,
+        "retmode": "json",
+        "retmax": 0,
+        "usehistory": "y"
     }
-    response = requests.get(url, params=params)
+    response = http_get("pubmed", url, params=_eutils_params(params))
     response.raise_for_status()
+    result = response.json()["esearchresult"]
+    history = {
+        "count": int(result.get("count", 0)),
+        "webenv": result["webenv"],
+        "query_key": result["querykey"]
+    }
+    logger.info(f"PubMed history search: query='{query}', count={history['count']}")
+    return history
 
+def post_pmids_to_history(pmids: list[str]):
+    url = f"{PUBMED_EUTILS_BASE}/epost.fcgi"
+    response = http_post("pubmed", url, data=_eutils_params({"db": "pubmed", "id": ",".join(pmids)}), idempotent=True)
+    response.raise_for_status()
     root = ET.fromstring(response.content)
+    return {
+        "count": len(pmids),
+        "webenv": root.findtext("WebEnv"),
+        "query_key": root.findtext("QueryKey")
+    }
+
+def parse_pubmed_article(article: ET.Element):
+    # The one parsing path for efetch records; everything that needs PubMed
+    # metadata (including Zotero imports) reads these fields.
+    pmid = article.findtext(".//PMID")
+    title = article.findtext(".//ArticleTitle")
+    abstract = "\n".join([
+        (elem.attrib.get("Label", "") + ": " if elem.attrib.get("Label") else "") + (elem.text or "")
+        for elem in article.findall(".//AbstractText")
+    ]).strip()
+
+    author_list = [
+        {
+            "last_name": a.findtext("LastName"),
+            "fore_name": a.findtext("ForeName") or "",
+            "initials": a.findtext("Initials") or ""
+        }
+        for a in article.findall(".//Author") if a.findtext("LastName")
+    ]
+    authors = [f"{a['fore_name']} {a['last_name']}".strip() for a in author_list]
+
+    pubdate = " ".join(filter(None, [
+        article.findtext(".//PubDate/Year"),
+        article.findtext(".//PubDate/Month"),
+        article.findtext(".//PubDate/Day")
+    ])) or article.findtext(".//PubDate/MedlineDate")
+
+    doi = next(
+        (eid.text for eid in article.findall(".//ELocationID") if eid.attrib.get("EIdType") == "doi"),
+        None
+    )
+
+    return {
+        "pmid": pmid,
+        "title": title,
+        "abstract": abstract,
+        "authors": authors,
+        "author_list": author_list,
+        "journal": article.findtext(".//Journal/Title"),
+        "journal_abbrev": article.findtext(".//Journal/ISOAbbreviation"),
+        "volume": article.findtext(".//JournalIssue/Volume"),
+        "issue": article.findtext(".//JournalIssue/Issue"),
+        "pages": article.findtext(".//Pagination/MedlinePgn"),
+        "pubdate": pubdate,
+        "doi": doi,
+        "link": f"https://pubmed.ncbi.nlm.nih.gov/{pmid}/"
+    }
+
+def iter_pubmed_xml(stream):
+    # Incremental parse: each PubmedArticle is handed out as soon as its end
+    # tag is seen and then dropped from the tree, so memory stays flat.
+    context = ET.iterparse(stream, events=("start", "end"))
+    _, root = next(context)
+    for event, elem in context:
+        if event == "end" and elem.tag == "PubmedArticle":
+            yield parse_pubmed_article(elem)
+            root.clear()
+
+def _store_articles(articles: list):
+    article_cache.put_articles(articles)
+    search_index.index_pubmed_articles(articles)
+
+def _iter_efetch(data: dict):
+    url = f"{PUBMED_EUTILS_BASE}/efetch.fcgi"
+    # POST keeps long ID lists out of the URL
+    response = http_post("pubmed", url, data=_eutils_params({"db": "pubmed", "retmode": "xml", **data}), stream=True, idempotent=True)
+    # Every parsed record is written through to the article cache and the
+    # local search index
+    pending = []
+    try:
+        response.raise_for_status()
+        response.raw.decode_content = True
+        for article in iter_pubmed_xml(response.raw):
+            # A caller's deadline (clients.http.deadline) also ends a body
+            # that is still trickling in
+            check_deadline()
+            pending.append(article)
+            if len(pending) >= 100:
+                _store_articles(pending)
+                pending = []
+            yield article
+    finally:
+        # Compressed bytes actually read off the wire
+        metrics.UPSTREAM_BYTES.inc(response.raw.tell(), upstream="pubmed")
+        response.close()
+        _store_articles(pending)
+
+def _history_params(history: dict, retstart: int, retmax: int):
+    return {
+        "WebEnv": history["webenv"],
+        "query_key": history["query_key"],
+        "retstart": retstart,
+        "retmax": retmax
+    }
+
+def _efetch_ids(pmids: list[str]):
+    return list(_iter_efetch({"id": ",".join(pmids)}))
+
+def _efetch_history(history: dict, retstart: int, retmax: int):
+    articles = list(_iter_efetch(_history_params(history, retstart, retmax)))
+    logger.info(f"History efetch: retstart={retstart}, retmax={retmax}, parsed={len(articles)}")
+    return articles
+
+def _chunks(items: list, size: int):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+def _run_chunks(func, chunks: list, max_workers: int):
+    if len(chunks) <= 1:
+        return [func(chunk) for chunk in chunks]
+    # Results come back in chunk (upstream) order; each chunk runs in a copy
+    # of the caller's context so a clients.http.deadline applies to it too
+    with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="pubmed-batch") as executor:
+        futures = [executor.submit(contextvars.copy_context().run, func, chunk) for chunk in chunks]
+        return [future.result() for future in futures]
+
+def fetch_pubmed_details(pmids: list[str], chunk_size: int = BATCH_SIZE, max_workers: int = BATCH_WORKERS):
+    # Only cache misses go upstream; the result keeps the requested order
+    by_pmid = article_cache.get_articles(pmids)
+    misses = [pmid for pmid in dict.fromkeys(pmids) if pmid not in by_pmid]
+    for batch in _run_chunks(_efetch_ids, _chunks(misses, chunk_size), max_workers):
+        by_pmid.update((article["pmid"], article) for article in batch)
+    results = [by_pmid[pmid] for pmid in dict.fromkeys(pmids) if pmid in by_pmid]
+    logger.info(f"Fetched details for {len(pmids)} PMIDs ({len(misses)} from PubMed) | Parsed {len(results)} articles")
+    return results
+
+def iter_pubmed_details(pmids: list[str], chunk_size: int = BATCH_SIZE):
+    # Records come out in request order (each PMID once). Misses are fetched
+    # chunk_size at a time and each is emitted as soon as it and every PMID
+    # before it are out; PMIDs PubMed does not return are left out.
+    pmids = list(dict.fromkeys(pmids))
+    cached = article_cache.get_articles(pmids)
+    chunks = iter(_chunks([pmid for pmid in pmids if pmid not in cached], chunk_size))
+    chunk, fetched, early = set(), None, {}
+    try:
+        for pmid in pmids:
+            if pmid in cached:
+                yield cached[pmid]
+                continue
+            if pmid not in chunk:
+                if fetched is not None:
+                    fetched.close()
+                ids = next(chunks)
+                chunk, fetched, early = set(ids), _iter_efetch({"id": ",".join(ids)}), {}
+            # Records that arrive ahead of their turn wait in early
+            while pmid not in early:
+                article = next(fetched, None)
+                if article is None:
+                    break
+                early[article["pmid"]] = article
+            if pmid in early:
+                yield early.pop(pmid)
+    finally:
+        if fetched is not None:
+            fetched.close()
+
+def _history_windows(query: Optional[str], pmids: Optional[list[str]], max_records: Optional[int], chunk_size: int):
+    if query:
+        history = search_pubmed_history(query)
+    elif pmids:
+        history = post_pmids_to_history(pmids)
+    else:
+        return None, []
+
+    total = history["count"] if max_records is None else min(history["count"], max_records)
+    windows = [(start, min(chunk_size, total - start)) for start in range(0, total, chunk_size)]
+    return history, windows
+
+def iter_pubmed_batch(
+    query: Optional[str] = None,
+    pmids: Optional[list[str]] = None,
+    max_records: Optional[int] = None,
+    chunk_size: int = BATCH_SIZE
+):
+    if pmids and not query:
+        # Explicit PMID lists only send cache misses to the History server
+        pmids = list(dict.fromkeys(pmids))[:max_records]
+        cached = article_cache.get_articles(pmids)
+        yield from cached.values()
+        pmids = [pmid for pmid in pmids if pmid not in cached]
+    # Chunks are streamed one after another so only one efetch body is open
+    history, windows = _history_windows(query, pmids, max_records, chunk_size)
+    for window in windows:
+        yield from _iter_efetch(_history_params(history, *window))
+
+def iter_pubmed_history(history: dict, start: int = 0, max_records: Optional[int] = None, chunk_size: int = BATCH_SIZE):
+    # Streams records [start, total) of a History server result set, so a
+    # long pull can be resumed part way through
+    total = history["count"] if max_records is None else min(history["count"], max_records)
+    for retstart in range(start, total, chunk_size):
+        yield from _iter_efetch(_history_params(history, retstart, min(chunk_size, total - retstart)))
+
+def fetch_pubmed_batch(
+    query: Optional[str] = None,
+    pmids: Optional[list[str]] = None,
+    max_records: Optional[int] = None,
+    chunk_size: int = BATCH_SIZE,
+    max_workers: int = BATCH_WORKERS
+):
+    by_pmid = {}
+    if pmids and not query:
+        # Explicit PMID lists only send cache misses to the History server
+        pmids = list(dict.fromkeys(pmids))[:max_records]
+        by_pmid = article_cache.get_articles(pmids)
+        requested, pmids = pmids, [pmid for pmid in pmids if pmid not in by_pmid]
+
+    history, windows = _history_windows(query, pmids, max_records, chunk_size)
     results = []
+    for batch in _run_chunks(lambda w: _efetch_history(history, *w), windows, max_workers):
+        results.extend(batch)
+    if windows:
+        logger.info(f"Batch fetch: {len(results)} of {history['count']} records in {len(windows)} chunks")
+
+    if by_pmid:
+        by_pmid.update((article["pmid"], article) for article in results)
+        results = [by_pmid[pmid] for pmid in requested if pmid in by_pmid]
+    return results
+
+def _esummary_ids(pmids: list[str]):
+    url = f"{PUBMED_EUTILS_BASE}/esummary.fcgi"
+    response = http_post("pubmed", url, data=_eutils_params({"db": "pubmed", "retmode": "json", "id": ",".join(pmids)}), idempotent=True)
+    response.raise_for_status()
+    result = response.json()["result"]
+
+    summaries = []
+    for pmid in pmids:
+        if pmid in result:
+            doc = result[pmid]
+            summaries.append({
+                "pmid": pmid,
+                "title": doc.get("title"),
+                "authors": ", ".join([a["name"] for a in doc.get("authors", [])]),
+                "source": doc.get("source"),
+                "pubdate": doc.get("pubdate"),
+                "link": f"https://pubmed.ncbi.nlm.nih.gov/{pmid}/"
+            })
+    return summaries
+
+def _summary_from_record(record: dict):
+    return {
+        "pmid": record["pmid"],
+        "title": record.get("title"),
+        "authors": ", ".join(f"{a['last_name']} {a['initials']}".strip() for a in record.get("author_list", [])),
+        "source": record.get("journal_abbrev") or record.get("journal"),
+        "pubdate": record.get("pubdate"),
+        "link": record.get("link")
+    }
 
-    for article in root.findall(".//PubmedArticle"):
-        pmid = article.findtext(".//PMID")
-        title = article.findtext(".//ArticleTitle")
-        abstract = "\n".join([
-            (elem.attrib.get("Label", "") + ": " if elem.attrib.get("Label") else "") + (elem.text or "")
-            for elem in article.findall(".//AbstractText")
-        ]).strip()
-
-        authors = [
-            f"{a.findtext('ForeName')} {a.findtext('LastName')}".strip()
-            for a in article.findall(".//Author") if a.findtext("LastName")
-        ]
-
-        results.append({
-            "pmid": pmid,
-            "title": title,
-            "abstract": abstract,
-            "authors": authors,
-            "link": f"https://pubmed.ncbi.nlm.nih.gov/{pmid}/"
-        })
-
-    logger.info(f"Fetched details for PMIDs: {pmids} | Parsed {len(results)} articles")
-    return results
\ No newline at end of file
+def fetch_pubmed_summaries(pmids: list[str], chunk_size: int = BATCH_SIZE, max_workers: int = BATCH_WORKERS):
+    # Records already in the article cache are summarised locally; only the
+    # rest go to esummary
+    by_pmid = {pmid: _summary_from_record(r) for pmid, r in article_cache.get_articles(pmids).items()}
+    misses = [pmid for pmid in dict.fromkeys(pmids) if pmid not in by_pmid]
+    for batch in _run_chunks(_esummary_ids, _chunks(misses, chunk_size), max_workers):
+        by_pmid.update((summary["pmid"], summary) for summary in batch)
+    return [by_pmid[pmid] for pmid in dict.fromkeys(pmids) if pmid in by_pmid]
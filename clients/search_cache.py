@@ -0,0 +1,85 @@
+import os
+import time
+import threading
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from clients import metrics
+
+# Set up basic logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# In-process cache of upstream search results keyed on normalized query
+# parameters. Entries younger than SEARCH_CACHE_TTL are served as HIT; up to
+# SEARCH_CACHE_STALE_TTL they are served as STALE while a background refresh
+# replaces them; anything older is a MISS.
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "300"))
+SEARCH_CACHE_STALE_TTL = float(os.getenv("SEARCH_CACHE_STALE_TTL", "3600"))
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "1000"))
+
+HIT, STALE, MISS = "HIT", "STALE", "MISS"
+
+_entries: OrderedDict = OrderedDict()
+_refreshing: set = set()
+_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="search-refresh")
+
+def normalize_key(source: str, **params) -> tuple:
+    normalized = []
+    for name, value in sorted(params.items()):
+        if isinstance(value, str):
+            value = " ".join(value.split())
+        normalized.append((name, value))
+    return (source, tuple(normalized))
+
+def _store(key: tuple, value):
+    with _lock:
+        _entries[key] = (value, time.monotonic())
+        _entries.move_to_end(key)
+        while len(_entries) > SEARCH_CACHE_MAX_ENTRIES:
+            _entries.popitem(last=False)
+
+def _refresh(key: tuple, loader):
+    try:
+        _store(key, loader())
+        logger.info(f"Refreshed stale search result for {key[0]}")
+    except Exception as e:
+        logger.warning(f"Background refresh for {key[0]} failed: {e}")
+    finally:
+        with _lock:
+            _refreshing.discard(key)
+
+def cached_search(source: str, loader, **params):
+    # Returns (result, status) where status is HIT, STALE or MISS
+    value, status = _cached_search(source, loader, **params)
+    metrics.CACHE_REQUESTS.inc(cache=f"search_{source}", result=status.lower())
+    return value, status
+
+def _cached_search(source: str, loader, **params):
+    key = normalize_key(source, **params)
+    with _lock:
+        entry = _entries.get(key)
+        if entry is not None:
+            _entries.move_to_end(key)
+
+    if entry is not None:
+        value, stored_at = entry
+        age = time.monotonic() - stored_at
+        if age < SEARCH_CACHE_TTL:
+            return value, HIT
+        if age < SEARCH_CACHE_STALE_TTL:
+            with _lock:
+                start_refresh = key not in _refreshing
+                _refreshing.add(key)
+            if start_refresh:
+                _executor.submit(_refresh, key, loader)
+            return value, STALE
+
+    value = loader()
+    _store(key, value)
+    return value, MISS
+
+def clear():
+    with _lock:
+        _entries.clear()
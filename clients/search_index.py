@@ -0,0 +1,141 @@
+import os
+import re
+import json
+import logging
+from typing import Optional
+from clients.storage import SQLiteStore, cache_path
+
+# Set up basic logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Local full-text index (SQLite FTS5) over everything the API has fetched:
+# PubMed titles/abstracts, Elsevier full texts and extracted Zotero PDF pages.
+# Documents are replaced by doc_id, so re-indexing the same record is safe.
+# FTS5 cannot index doc_id, so doc_rowids maps it to the FTS rowid and
+# replacing a document deletes by rowid instead of scanning the table.
+#
+# PDF pages come from private Zotero libraries: they carry the library
+# (clients.zotero_client.library_id) and are only returned to searches made
+# with that library's credentials.
+
+SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS documents USING fts5(
+    doc_id UNINDEXED,
+    kind UNINDEXED,
+    title,
+    body,
+    metadata UNINDEXED,
+    library UNINDEXED,
+    tokenize = 'porter unicode61'
+);
+CREATE TABLE IF NOT EXISTS doc_rowids (
+    doc_id TEXT PRIMARY KEY,
+    doc_rowid INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO doc_rowids (doc_id, doc_rowid)
+    SELECT doc_id, rowid FROM documents WHERE NOT EXISTS (SELECT 1 FROM doc_rowids);
+"""
+
+# search_index.sqlite3 held PDF pages without an owner; it is dropped and
+# rebuilt as content is fetched again
+for _suffix in ("", "-wal", "-shm"):
+    if os.path.exists(cache_path("search_index.sqlite3" + _suffix)):
+        os.remove(cache_path("search_index.sqlite3" + _suffix))
+_store = SQLiteStore(cache_path("search_index.v2.sqlite3"), SCHEMA)
+
+def _index(docs: list[tuple], library: str = None):
+    # docs: (doc_id, kind, title, body, metadata)
+    if not docs:
+        return
+    try:
+        with _store.transaction() as conn:
+            for doc_id, kind, title, body, meta in docs:
+                row = conn.execute("SELECT doc_rowid FROM doc_rowids WHERE doc_id = ?", (doc_id,)).fetchone()
+                if row is not None:
+                    conn.execute("DELETE FROM documents WHERE rowid = ?", (row["doc_rowid"],))
+                rowid = conn.execute(
+                    "INSERT INTO documents (doc_id, kind, title, body, metadata, library) VALUES (?, ?, ?, ?, ?, ?)",
+                    (doc_id, kind, title or "", body or "", json.dumps(meta), library)
+                ).lastrowid
+                conn.execute("INSERT OR REPLACE INTO doc_rowids (doc_id, doc_rowid) VALUES (?, ?)", (doc_id, rowid))
+    except Exception as e:
+        # The index is a side effect; never fail the request that fed it
+        logger.warning(f"Search index update failed: {e}")
+
+def index_pubmed_articles(articles: list[dict]):
+    _index([
+        (
+            f"pmid:{a['pmid']}", "pubmed", a.get("title"), a.get("abstract"),
+            {"pmid": a["pmid"], "doi": a.get("doi"), "journal": a.get("journal"),
+             "pubdate": a.get("pubdate"), "link": a.get("link")}
+        )
+        for a in articles if a.get("pmid")
+    ])
+
+def index_elsevier_full_text(doi: str, paragraphs: list[str]):
+    if not paragraphs:
+        return
+    # The first paragraph usually carries the title line
+    _index([(f"doi:{doi.lower()}", "elsevier", paragraphs[0][:500], "\n\n".join(paragraphs), {"doi": doi})])
+
+def index_pdf_pages(library: str, item_key: str, title: str, first_page: int, pages: list[str], attachment_key: str = None):
+    # library: clients.zotero_client.library_id of the owner
+    _index([
+        (
+            f"zotero:{library}:{item_key}:{first_page + i}", "pdf_page", title, text,
+            {"item_key": item_key, "attachment_key": attachment_key, "page": first_page + i}
+        )
+        for i, text in enumerate(pages) if text.strip()
+    ], library)
+
+def to_match_query(query: str) -> str:
+    # Plain keyword input: every term must match; quoting each term keeps
+    # user punctuation from being read as FTS5 syntax
+    terms = re.findall(r"\w+", query)
+    return " ".join(f'"{t}"' for t in terms)
+
+def search(
+    query: str,
+    limit: int = 20,
+    offset: int = 0,
+    kind: Optional[str] = None,
+    raw: bool = False,
+    library: Optional[str] = None
+) -> dict:
+    # PDF pages are only searched within library; without one they are left out
+    match = query if raw else to_match_query(query)
+    if not match:
+        return {"total": 0, "results": []}
+    where = "documents MATCH ?"
+    params = [match]
+    if kind:
+        where += " AND kind = ?"
+        params.append(kind)
+    if library:
+        where += " AND (kind != 'pdf_page' OR library = ?)"
+        params.append(library)
+    else:
+        where += " AND kind != 'pdf_page'"
+
+    total = _store.query(f"SELECT COUNT(*) AS n FROM documents WHERE {where}", params)[0]["n"]
+    rows = _store.query(
+        f"SELECT doc_id, kind, title, metadata, bm25(documents, 0.0, 0.0, 5.0, 1.0, 0.0, 0.0) AS score, "
+        f"snippet(documents, 3, '[', ']', ' … ', 24) AS snippet "
+        f"FROM documents WHERE {where} ORDER BY score LIMIT ? OFFSET ?",
+        (*params, limit, offset)
+    )
+    return {
+        "total": total,
+        "results": [
+            {
+                "doc_id": row["doc_id"],
+                "kind": row["kind"],
+                "title": row["title"],
+                "snippet": row["snippet"],
+                "score": round(-row["score"], 4),
+                **json.loads(row["metadata"])
+            }
+            for row in rows
+        ]
+    }
@@ -0,0 +1,58 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# Local persistent stores (caches, mirrors, indexes) live under CACHE_DIR,
+# one SQLite file per store.
+CACHE_DIR = os.getenv("CACHE_DIR", ".cache")
+
+def cache_path(name: str) -> str:
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    return os.path.join(CACHE_DIR, name)
+
+class SQLiteStore:
+    # A single shared connection guarded by a lock; SQLite calls are short, so
+    # serialising them is cheaper than a connection per worker thread.
+
+    def __init__(self, path: str, schema: str):
+        self.path = path
+        self._schema = schema
+        self._conn = None
+        self._lock = threading.RLock()
+
+    def _connect(self):
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(self._schema)
+            self._conn = conn
+        return self._conn
+
+    @contextmanager
+    def transaction(self):
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def query(self, sql: str, params=()):
+        with self._lock:
+            return self._connect().execute(sql, params).fetchall()
+
+    def execute(self, sql: str, params=()):
+        with self._lock:
+            return self._connect().execute(sql, params).rowcount
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -0,0 +1,224 @@
+import os
+import time
+import random
+import hashlib
+import threading
+import logging
+import requests
+from clients import metrics
+from email.utils import parsedate_to_datetime
+
+# Set up basic logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Shared throttling for every outbound call (see clients.http.request):
+#   - a token bucket per upstream and API key, sized to the upstream's
+#     published limit. It halves its rate on a 429 and creeps back afterwards,
+#     and it pauses when the server says so (Retry-After, Zotero's Backoff,
+#     Elsevier's X-RateLimit-Remaining: 0).
+#   - jittered exponential retries that prefer the server's Retry-After.
+#   - a circuit breaker per upstream that fails fast after repeated errors.
+# Settings follow the clients.http scheme: {UPSTREAM}_NAME, then HTTP_NAME.
+
+# Requests per second. NCBI allows 3/s, or 10/s with an API key; Elsevier's
+# search APIs allow about 9/s per key. 0 disables the bucket.
+DEFAULT_RATES = {"pubmed": 3.0, "elsevier": 9.0, "zotero": 10.0}
+PUBMED_KEYED_RATE = 10.0
+MIN_RATE_FRACTION = 0.1  # adaptive slow-down never goes below 10% of the limit
+RECOVERY_FRACTION = 0.05  # each success restores 5% of the limit
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# The server did not process these, so even non-idempotent calls may be resent
+REJECTED_STATUSES = {429, 503}
+
+def setting(upstream: str, name: str, default: str) -> float:
+    value = os.getenv(f"{upstream.upper()}_{name}") or os.getenv(f"HTTP_{name}", default)
+    return float(value)
+
+class UpstreamUnavailable(requests.ConnectionError):
+    # Raised without contacting the upstream while its circuit is open
+    pass
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.limit = rate
+        self.rate = rate
+        self.capacity = max(1.0, burst)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        # Takes a token, going into debt when none are left; the caller then
+        # sleeps off its share of the debt, so waiters are served in order.
+        with self._lock:
+            now = time.monotonic()
+            wait = self.paused_until - now
+            if self.rate > 0:
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                self.tokens -= 1
+                if self.tokens < 0:
+                    wait = max(wait, -self.tokens / self.rate)
+        if wait > 0:
+            time.sleep(wait)
+
+    def pause(self, seconds: float):
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def slow_down(self):
+        with self._lock:
+            if self.limit > 0:
+                self.rate = max(self.limit * MIN_RATE_FRACTION, self.rate / 2)
+                logger.warning(f"Rate limited; slowing to {self.rate:.2f} requests/s")
+
+    def recover(self):
+        if self.rate < self.limit:
+            with self._lock:
+                self.rate = min(self.limit, self.rate + self.limit * RECOVERY_FRACTION)
+
+class CircuitBreaker:
+    # closed -> open after failure_threshold consecutive failures; after
+    # reset_timeout one trial call is let through (half-open) and its outcome
+    # closes or re-opens the circuit.
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if time.monotonic() - self.opened_at >= self.reset_timeout else "open"
+
+    def before_call(self) -> bool:
+        # True when this call is the half-open trial
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return False
+            if state == "half-open" and not self.trial_running:
+                self.trial_running = True
+                return True
+            retry_in = max(0.0, self.opened_at + self.reset_timeout - time.monotonic())
+        raise UpstreamUnavailable(f"{self.name} is unavailable; circuit open, retrying in {retry_in:.0f}s")
+
+    def record_success(self):
+        with self._lock:
+            if self.opened_at is not None:
+                logger.info(f"Circuit for {self.name} closed")
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def release_trial(self):
+        # The trial ended without saying anything about the upstream (e.g. the
+        # caller's deadline cut it short); let the next call try instead
+        with self._lock:
+            self.trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.trial_running or self.failures >= self.failure_threshold:
+                if self.opened_at is None or self.trial_running:
+                    logger.warning(f"Circuit for {self.name} opened after {self.failures} failures")
+                self.opened_at = time.monotonic()
+                self.trial_running = False
+
+_buckets: dict = {}
+_breakers: dict = {}
+_registry_lock = threading.Lock()
+
+def api_key_of(upstream: str, kwargs: dict) -> str:
+    headers = kwargs.get("headers") or {}
+    key = headers.get("X-ELS-APIKey") or headers.get("Zotero-API-Key")
+    if not key:
+        for field in ("params", "data"):
+            if isinstance(kwargs.get(field), dict) and kwargs[field].get("api_key"):
+                key = kwargs[field]["api_key"]
+    return key or ""
+
+def bucket_for(upstream: str, api_key: str = "") -> TokenBucket:
+    # Keys are hashed so raw API keys are not held as dict keys
+    bucket_key = (upstream, hashlib.sha256(api_key.encode()).hexdigest()[:16] if api_key else "")
+    bucket = _buckets.get(bucket_key)
+    if bucket is None:
+        with _registry_lock:
+            bucket = _buckets.get(bucket_key)
+            if bucket is None:
+                default = DEFAULT_RATES.get(upstream, 0.0)
+                if upstream == "pubmed" and api_key:
+                    default = PUBMED_KEYED_RATE
+                rate = setting(upstream, "RATE_LIMIT", str(default))
+                burst = setting(upstream, "RATE_BURST", str(max(rate, 1.0)))
+                bucket = _buckets[bucket_key] = TokenBucket(rate, burst)
+    return bucket
+
+def breaker_for(upstream: str) -> CircuitBreaker:
+    breaker = _breakers.get(upstream)
+    if breaker is None:
+        with _registry_lock:
+            breaker = _breakers.get(upstream)
+            if breaker is None:
+                breaker = _breakers[upstream] = CircuitBreaker(
+                    upstream,
+                    int(setting(upstream, "CIRCUIT_FAILURES", "5")),
+                    setting(upstream, "CIRCUIT_RESET", "30")
+                )
+    return breaker
+
+def retry_after(response) -> float:
+    # Retry-After as seconds or an HTTP date; Zotero also sends Backoff
+    value = response.headers.get("Retry-After") or response.headers.get("Backoff")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+def observe(upstream: str, bucket: TokenBucket, response):
+    # Applies rate hints carried by any response, successful or not. Pauses
+    # are capped at RETRY_MAX_DELAY so an exhausted weekly quota fails
+    # instead of hanging.
+    cap = setting(upstream, "RETRY_MAX_DELAY", "30")
+    backoff = response.headers.get("Backoff")
+    if backoff:
+        try:
+            bucket.pause(min(cap, float(backoff)))
+        except ValueError:
+            pass
+    if response.headers.get("X-RateLimit-Remaining") == "0":
+        reset = response.headers.get("X-RateLimit-Reset")
+        try:
+            bucket.pause(min(cap, max(0.0, float(reset) - time.time())))
+        except (TypeError, ValueError):
+            pass
+
+def backoff_delay(upstream: str, attempt: int, response=None) -> float:
+    hinted = retry_after(response) if response is not None else None
+    cap = setting(upstream, "RETRY_MAX_DELAY", "30")
+    if hinted is not None:
+        return min(hinted, cap)
+    # Full jitter: uniform in [0, base * 2^attempt]
+    return random.uniform(0, min(cap, setting(upstream, "RETRY_BASE_DELAY", "0.5") * 2 ** attempt))
+
+CIRCUIT_STATES = {"closed": 0, "half-open": 1, "open": 2}
+
+metrics.Gauge(
+    "littools_upstream_circuit_state", "Circuit breaker state per upstream (0 closed, 1 half-open, 2 open)",
+    lambda: {(name,): CIRCUIT_STATES[breaker.state] for name, breaker in list(_breakers.items())},
+    ("upstream",)
+)
@@ -0,0 +1,160 @@
+import os
+import hashlib
+import threading
+import logging
+import requests
+from typing import Optional
+from clients import metrics
+from clients.http import http_get, http_post
+
+# Set up basic logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+ZOTERO_API_BASE = os.getenv("ZOTERO_API_BASE", "https://api.zotero.org")
+PAGE_SIZE = 100  # Zotero's maximum page size
+WRITE_BATCH_SIZE = 50  # Zotero's maximum number of objects per write request
+
+# Attachment downloads are streamed to disk in DOWNLOAD_CHUNK_SIZE pieces and
+# aborted once they pass MAX_ATTACHMENT_BYTES
+MAX_ATTACHMENT_BYTES = int(os.getenv("ZOTERO_MAX_ATTACHMENT_BYTES", str(200 * 1024 ** 2)))
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+def zotero_headers(api_key: str, **extra) -> dict:
+    return {"Zotero-API-Key": api_key, "Zotero-API-Version": "3", **extra}
+
+def library_id(user_id: str, api_key: str) -> str:
+    # Keep keys with different permissions on the same library apart without
+    # holding or storing the raw key
+    return f"{user_id}:{hashlib.sha256(api_key.encode()).hexdigest()[:16]}"
+
+def get_all_pages(url: str, api_key: str, params: Optional[dict] = None, headers: Optional[dict] = None):
+    # Returns (items, response of the first page) so callers can read
+    # Last-Modified-Version; a 304 on the first page returns ([], response).
+    params = {**(params or {}), "limit": PAGE_SIZE, "start": 0}
+    first = http_get("zotero", url, headers=zotero_headers(api_key, **(headers or {})), params=params)
+    if first.status_code == 304:
+        return [], first
+    first.raise_for_status()
+    items = first.json()
+    total = int(first.headers.get("Total-Results", len(items)))
+
+    start = len(items)
+    while items and start < total:
+        resp = http_get("zotero", url, headers=zotero_headers(api_key), params={**params, "start": start})
+        resp.raise_for_status()
+        batch = resp.json()
+        if not batch:
+            break
+        items.extend(batch)
+        start += len(batch)
+    return items, first
+
+def get_children(user_id: str, api_key: str, item_key: str):
+    url = f"{ZOTERO_API_BASE}/users/{user_id}/items/{item_key}/children"
+    resp = http_get("zotero", url, headers=zotero_headers(api_key))
+    resp.raise_for_status()
+    return resp.json()
+
+def download_attachment(user_id: str, api_key: str, attachment_key: str, dest, max_bytes: int = MAX_ATTACHMENT_BYTES) -> int:
+    # Writes the file into the open binary file object dest and returns its size
+    url = f"{ZOTERO_API_BASE}/users/{user_id}/items/{attachment_key}/file"
+    with http_get("zotero", url, headers=zotero_headers(api_key), stream=True) as resp:
+        resp.raise_for_status()
+        declared = int(resp.headers.get("Content-Length") or 0)
+        if declared > max_bytes:
+            raise ValueError(f"Attachment is {declared} bytes, over the {max_bytes} byte limit")
+        size = 0
+        for chunk in resp.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+            size += len(chunk)
+            if size > max_bytes:
+                raise ValueError(f"Attachment exceeds the {max_bytes} byte limit")
+            dest.write(chunk)
+    metrics.UPSTREAM_BYTES.inc(size, upstream="zotero")
+    return size
+
+# name -> key resolution. The full collection listing is cached per library
+# and revalidated with If-Modified-Since-Version, so an unchanged library
+# costs a single 304.
+_collections_cache: dict = {}
+_collections_lock = threading.Lock()
+
+def list_collections(user_id: str, api_key: str) -> list:
+    cache_key = library_id(user_id, api_key)
+    with _collections_lock:
+        cached = _collections_cache.get(cache_key)
+
+    url = f"{ZOTERO_API_BASE}/users/{user_id}/collections"
+    conditional = {"If-Modified-Since-Version": str(cached["version"])} if cached else {}
+    collections, resp = get_all_pages(url, api_key, headers=conditional)
+    if resp.status_code == 304:
+        logger.debug(f"Collections for user {user_id} unchanged at version {cached['version']}")
+        return cached["collections"]
+
+    entry = {
+        "version": int(resp.headers.get("Last-Modified-Version", 0)),
+        "collections": collections,
+        "by_name": {}
+    }
+    for c in collections:
+        entry["by_name"].setdefault(c["data"]["name"], c["data"]["key"])
+    with _collections_lock:
+        _collections_cache[cache_key] = entry
+    logger.info(f"Listed {len(collections)} collections for user {user_id} at version {entry['version']}")
+    return collections
+
+def resolve_collection_key(user_id: str, api_key: str, collection_name: str) -> Optional[str]:
+    list_collections(user_id, api_key)
+    with _collections_lock:
+        entry = _collections_cache.get(library_id(user_id, api_key))
+    return entry["by_name"].get(collection_name) if entry else None
+
+def invalidate_collections(user_id: str, api_key: str):
+    with _collections_lock:
+        _collections_cache.pop(library_id(user_id, api_key), None)
+
+def ensure_collection(user_id: str, api_key: str, collection_name: str) -> str:
+    collection_key = resolve_collection_key(user_id, api_key, collection_name)
+    if collection_key:
+        return collection_key
+
+    resp = http_post(
+        "zotero",
+        f"{ZOTERO_API_BASE}/users/{user_id}/collections",
+        headers=zotero_headers(api_key, **{"Content-Type": "application/json"}),
+        json=[{"data": {"name": collection_name}}]
+    )
+    resp.raise_for_status()
+    collection_key = list(resp.json()["successful"].values())[0]["key"]
+    invalidate_collections(user_id, api_key)
+    logger.info(f"Created collection '{collection_name}' with key: {collection_key}")
+    return collection_key
+
+def create_items(user_id: str, api_key: str, items: list[dict]) -> list[dict]:
+    # Writes items in batches of WRITE_BATCH_SIZE and returns one outcome per
+    # input item: {"key": ...} on success or {"error": ...} on failure. A
+    # batch the request failed for marks only its own items; later batches
+    # are still written.
+    outcomes = []
+    url = f"{ZOTERO_API_BASE}/users/{user_id}/items"
+    for start in range(0, len(items), WRITE_BATCH_SIZE):
+        batch = items[start:start + WRITE_BATCH_SIZE]
+        try:
+            resp = http_post(
+                "zotero", url,
+                headers=zotero_headers(api_key, **{"Content-Type": "application/json"}),
+                json=batch
+            )
+            resp.raise_for_status()
+            result = resp.json()
+        except (requests.RequestException, ValueError) as e:
+            logger.warning(f"Zotero write of items {start + 1}-{start + len(batch)} failed: {e}")
+            outcomes.extend({"error": f"Zotero write failed: {e}"} for _ in batch)
+            continue
+        successful, failed = result.get("successful", {}), result.get("failed", {})
+        for i in range(len(batch)):
+            if str(i) in successful:
+                outcomes.append({"key": successful[str(i)]["key"]})
+            else:
+                outcomes.append({"error": failed.get(str(i), {}).get("message", "Not written")})
+    return outcomes
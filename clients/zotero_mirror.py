@@ -0,0 +1,172 @@
+import os
+import json
+import time
+import threading
+import logging
+from typing import Optional
+from clients.http import http_get
+from clients.storage import SQLiteStore, cache_path
+from clients.zotero_client import ZOTERO_API_BASE, get_all_pages, library_id, zotero_headers
+
+# Set up basic logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Local copy of each Zotero library, kept current with ?since=<version> and
+# the /deleted endpoint. Reads sync first unless the mirror was synced less
+# than max_age seconds ago.
+MIRROR_MAX_AGE = float(os.getenv("ZOTERO_MIRROR_MAX_AGE", "60"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS libraries (
+    library TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    synced_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS items (
+    library TEXT NOT NULL,
+    key TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    item_type TEXT,
+    parent_item TEXT,
+    date_modified TEXT,
+    deleted INTEGER NOT NULL DEFAULT 0,
+    item TEXT NOT NULL,
+    PRIMARY KEY (library, key)
+);
+CREATE INDEX IF NOT EXISTS items_parent ON items (library, parent_item);
+CREATE TABLE IF NOT EXISTS item_collections (
+    library TEXT NOT NULL,
+    collection_key TEXT NOT NULL,
+    item_key TEXT NOT NULL,
+    PRIMARY KEY (library, collection_key, item_key)
+);
+CREATE INDEX IF NOT EXISTS item_collections_item ON item_collections (library, item_key);
+"""
+
+_store = SQLiteStore(cache_path("zotero_mirror.sqlite3"), SCHEMA)
+_sync_locks: dict = {}
+_sync_locks_guard = threading.Lock()
+
+def _sync_lock(library: str) -> threading.Lock:
+    with _sync_locks_guard:
+        return _sync_locks.setdefault(library, threading.Lock())
+
+def _delete_items(conn, library: str, keys: list[str]):
+    conn.executemany("DELETE FROM items WHERE library = ? AND key = ?", [(library, k) for k in keys])
+    conn.executemany("DELETE FROM item_collections WHERE library = ? AND item_key = ?", [(library, k) for k in keys])
+
+def _upsert_items(conn, library: str, items: list[dict]):
+    _delete_items(conn, library, [item["key"] for item in items])
+    conn.executemany(
+        "INSERT INTO items (library, key, version, item_type, parent_item, date_modified, deleted, item) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        [
+            (
+                library,
+                item["key"],
+                item.get("version", 0),
+                item["data"].get("itemType"),
+                item["data"].get("parentItem"),
+                item["data"].get("dateModified"),
+                1 if item["data"].get("deleted") else 0,
+                json.dumps(item)
+            )
+            for item in items
+        ]
+    )
+    conn.executemany(
+        "INSERT OR IGNORE INTO item_collections (library, collection_key, item_key) VALUES (?, ?, ?)",
+        [(library, c, item["key"]) for item in items for c in item["data"].get("collections", [])]
+    )
+
+def sync_library(user_id: str, api_key: str, max_age: float = MIRROR_MAX_AGE) -> int:
+    library = library_id(user_id, api_key)
+    with _sync_lock(library):
+        rows = _store.query("SELECT version, synced_at FROM libraries WHERE library = ?", (library,))
+        since = rows[0]["version"] if rows else 0
+        if rows and time.time() - rows[0]["synced_at"] <= max_age:
+            return since
+
+        # Trashed items are included so moving an item to the trash reaches
+        # the mirror; reads filter them out.
+        url = f"{ZOTERO_API_BASE}/users/{user_id}/items"
+        conditional = {"If-Modified-Since-Version": str(since)} if rows else {}
+        changed, resp = get_all_pages(url, api_key, params={"since": since, "includeTrashed": 1}, headers=conditional)
+
+        deleted = []
+        if resp.status_code == 304:
+            version = since
+        else:
+            version = int(resp.headers.get("Last-Modified-Version", since))
+            if rows:
+                deleted_resp = http_get(
+                    "zotero",
+                    f"{ZOTERO_API_BASE}/users/{user_id}/deleted",
+                    headers=zotero_headers(api_key),
+                    params={"since": since}
+                )
+                deleted_resp.raise_for_status()
+                deleted = deleted_resp.json().get("items", [])
+
+        with _store.transaction() as conn:
+            _upsert_items(conn, library, changed)
+            _delete_items(conn, library, deleted)
+            conn.execute(
+                "INSERT OR REPLACE INTO libraries (library, version, synced_at) VALUES (?, ?, ?)",
+                (library, version, time.time())
+            )
+        if changed or deleted:
+            logger.info(
+                f"Synced Zotero library for user {user_id}: version {since} -> {version}, "
+                f"{len(changed)} changed, {len(deleted)} deleted"
+            )
+        return version
+
+def _collection_filter(item_type: Optional[str], exclude_types: Optional[list[str]]):
+    sql = (
+        " FROM items WHERE library = ? AND deleted = 0 AND ("
+        "key IN (SELECT item_key FROM item_collections WHERE library = ? AND collection_key = ?)"
+        " OR parent_item IN (SELECT item_key FROM item_collections WHERE library = ? AND collection_key = ?))"
+    )
+    params = []
+    if item_type:
+        sql += " AND item_type = ?"
+        params.append(item_type)
+    if exclude_types:
+        sql += f" AND item_type NOT IN ({','.join('?' * len(exclude_types))})"
+        params.extend(exclude_types)
+    return sql, params
+
+def get_collection_items(
+    user_id: str,
+    api_key: str,
+    collection_key: str,
+    item_type: Optional[str] = None,
+    exclude_types: Optional[list[str]] = None,
+    limit: Optional[int] = None,
+    start: int = 0,
+    max_age: float = MIRROR_MAX_AGE
+) -> list[dict]:
+    # Items in the collection plus their child items (attachments, notes),
+    # newest modification first like the web API's default sort
+    sync_library(user_id, api_key, max_age)
+    library = library_id(user_id, api_key)
+    where, params = _collection_filter(item_type, exclude_types)
+    rows = _store.query(
+        f"SELECT item{where} ORDER BY date_modified DESC, key LIMIT ? OFFSET ?",
+        (library, library, collection_key, library, collection_key, *params, -1 if limit is None else limit, start)
+    )
+    return [json.loads(row["item"]) for row in rows]
+
+def count_collection_items(
+    user_id: str,
+    api_key: str,
+    collection_key: str,
+    item_type: Optional[str] = None,
+    exclude_types: Optional[list[str]] = None
+) -> int:
+    library = library_id(user_id, api_key)
+    where, params = _collection_filter(item_type, exclude_types)
+    rows = _store.query(f"SELECT COUNT(*) AS n{where}", (library, library, collection_key, library, collection_key, *params))
+    return rows[0]["n"]
@@ -1,15 +1,25 @@
-from fastapi import APIRouter, Query
-from clients.embase_client import search_scopus, fetch_full_text_by_doi
+from fastapi import APIRouter, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
+from typing import Optional
+import json
+import logging
+from clients.embase_client import cached_search_scopus, fetch_full_text_by_doi, iter_deep_search, check_deep_token
+
+# Set up basic logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
 @router.get("/embase/search")
 def scopus_search(
+    response: Response,
     query: str,
     count: int = 10,
     start: int = 0  # pagination offset
 ):
-    results = search_scopus(query, count=count, start=start)
+    results, cache_status = cached_search_scopus(query, count=count, start=start)
+    response.headers["X-Cache-Status"] = cache_status
     return {"results": results}
 
 @router.get("/fulltext_by_doi")
@@ -18,4 +28,38 @@ def get_full_text_by_doi(
     para_start: int = 1,
     para_end: int = None
 ):
-    return fetch_full_text_by_doi(doi, para_start=para_start, para_end=para_end)
\ No newline at end of file
+    return fetch_full_text_by_doi(doi, para_start=para_start, para_end=para_end)
+
+@router.get("/search/deep")
+def deep_search(
+    query: str,
+    source: str = Query(default="scopus", pattern="^(scopus|sciencedirect)$"),
+    cursor: Optional[str] = None,  # resume token from a previous "page" record
+    max_records: Optional[int] = Query(default=None, ge=1)
+):
+    # NDJSON: one "record" line per result, a "page" line with the resume
+    # token after every upstream page, and a final "summary" line. The status
+    # is sent before the first page is fetched, so an upstream failure part
+    # way through ends the stream with an "error" line whose "next" resumes
+    # after the last page delivered.
+    try:
+        check_deep_token(source, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=f"Invalid cursor: {e}")
+
+    def ndjson():
+        count = 0
+        next_token = cursor
+        try:
+            for records, next_token, total in iter_deep_search(source, query, cursor, max_records):
+                for record in records:
+                    yield json.dumps({"type": "record", **record}) + "\n"
+                count += len(records)
+                yield json.dumps({"type": "page", "next": next_token, "total": total}) + "\n"
+        except Exception as e:
+            logger.warning(f"{source} deep search failed after {count} records: {e}")
+            yield json.dumps({"type": "error", "error": str(e), "count": count, "next": next_token}) + "\n"
+            return
+        yield json.dumps({"type": "summary", "source": source, "count": count, "next": next_token}) + "\n"
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
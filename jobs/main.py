@@ -0,0 +1,89 @@
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from typing import Optional
+import os
+import json
+import time
+import logging
+from clients.zotero_client import library_id
+from jobs.runner import FINISHED, get_job, list_jobs, get_records, cancel_job
+
+# Set up basic logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+# Jobs are submitted by the feature routers (e.g. POST /pubmed/fetch/jobs);
+# these routes report on them. Jobs submitted with Zotero credentials need
+# the same user_id and api_key here; someone else's job is a 404.
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1"))
+
+def _owner(user_id: Optional[str], api_key: Optional[str]) -> Optional[str]:
+    return library_id(user_id, api_key) if user_id and api_key else None
+
+def _job_or_404(job_id: str, owner: Optional[str]) -> dict:
+    job = get_job(job_id, owner)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found.")
+    return job
+
+@router.get("/")
+def list_jobs_endpoint(
+    user_id: str,
+    api_key: str,
+    status: Optional[str] = Query(default=None, pattern="^(queued|running|completed|failed|cancelled)$"),
+    limit: int = Query(default=50, ge=1, le=500)
+):
+    # Only the jobs submitted with these credentials
+    return list_jobs(library_id(user_id, api_key), status, limit)
+
+@router.get("/{job_id}")
+def get_job_endpoint(
+    job_id: str,
+    offset: int = Query(default=0, ge=0),
+    limit: int = Query(default=100, ge=0, le=1000),
+    user_id: Optional[str] = None,
+    api_key: Optional[str] = None
+):
+    # Status, progress and the records produced so far, from offset on
+    job = _job_or_404(job_id, _owner(user_id, api_key))
+    job["results"] = get_records(job_id, offset, limit)
+    return job
+
+@router.get("/{job_id}/stream")
+def stream_job_endpoint(
+    job_id: str,
+    offset: int = Query(default=0, ge=0),
+    user_id: Optional[str] = None,
+    api_key: Optional[str] = None
+):
+    # NDJSON: stored records from offset, then new ones as the job produces
+    # them; a final "job" line carries the finished status
+    owner = _owner(user_id, api_key)
+    _job_or_404(job_id, owner)
+
+    def ndjson():
+        seq = offset
+        while True:
+            job = get_job(job_id, owner)
+            records = get_records(job_id, seq, 1000)
+            for record in records:
+                yield json.dumps(record) + "\n"
+            if records:
+                seq = records[-1]["seq"] + 1
+                continue
+            if job is None or job["status"] in FINISHED:
+                yield json.dumps({"type": "job", **(job or {"id": job_id, "status": "deleted"})}) + "\n"
+                return
+            time.sleep(JOB_POLL_INTERVAL)
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+@router.delete("/{job_id}")
+def cancel_job_endpoint(job_id: str, user_id: Optional[str] = None, api_key: Optional[str] = None):
+    owner = _owner(user_id, api_key)
+    job = _job_or_404(job_id, owner)
+    if not cancel_job(job_id, owner):
+        raise HTTPException(status_code=409, detail=f"Job '{job_id}' already {job['status']}.")
+    return get_job(job_id, owner)
@@ -0,0 +1,281 @@
+import os
+import json
+import time
+import uuid
+import importlib
+import threading
+import logging
+from typing import Optional
+from clients import metrics
+from clients.storage import SQLiteStore, cache_path
+
+# Set up basic logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Background jobs for work that outlives an HTTP request. Jobs and every
+# record they produce are written to SQLite as they happen, so progress and
+# partial results can be read while a job runs and a job interrupted by a
+# restart is picked up again where it stopped. At most JOB_WORKERS jobs run
+# at once.
+#
+# A handler is a generator function handler(params, job) yielding
+# ("result" | "skipped", record) in a stable order; after a restart it is
+# called again with the params it last saved (job.save_params) and must skip
+# the first job.resume_from records.
+#
+# A job submitted with an owner (clients.zotero_client.library_id of the
+# submitting Zotero credentials) is only listed, read or cancelled with that
+# owner. Jobs without one (PubMed fetches) are readable by anyone holding
+# their id and are never listed.
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_RETENTION = float(os.getenv("JOB_RETENTION", str(7 * 24 * 3600)))
+FINISHED = ("completed", "failed", "cancelled")
+# Dropped from stored params once a job has finished
+SECRET_PARAMS = ("api_key",)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    owner TEXT,
+    params TEXT NOT NULL,
+    status TEXT NOT NULL,
+    total INTEGER,
+    done INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at);
+CREATE INDEX IF NOT EXISTS jobs_owner ON jobs (owner, created_at);
+CREATE TABLE IF NOT EXISTS job_records (
+    job_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    type TEXT NOT NULL,
+    record TEXT NOT NULL,
+    PRIMARY KEY (job_id, seq)
+);
+"""
+
+# jobs.sqlite3 held jobs without an owner; it is dropped rather than left
+# readable by anyone
+for _suffix in ("", "-wal", "-shm"):
+    if os.path.exists(cache_path("jobs.sqlite3" + _suffix)):
+        os.remove(cache_path("jobs.sqlite3" + _suffix))
+_store = SQLiteStore(cache_path("jobs.v2.sqlite3"), SCHEMA)
+_handlers: dict = {}
+_handler_modules: dict = {}
+_workers: list = []
+_cancelled: set = set()
+_wakeup = threading.Event()
+_stopping = threading.Event()
+
+def _queue_depth() -> dict:
+    depth = {("queued",): 0, ("running",): 0}
+    for row in _store.query("SELECT status, COUNT(*) AS n FROM jobs WHERE status IN ('queued', 'running') GROUP BY status"):
+        depth[(row["status"],)] = row["n"]
+    return depth
+
+metrics.Gauge("littools_job_queue_depth", "Background jobs waiting or running", _queue_depth, ("status",))
+
+def register_job(kind: str, handler):
+    _handlers[kind] = handler
+
+def declare_job(kind: str, module: str):
+    # The module registers the handler on import; lets jobs run (e.g. resume
+    # after a restart) before anything else has imported it
+    _handler_modules[kind] = module
+
+def _handler(kind: str):
+    if kind not in _handlers and kind in _handler_modules:
+        importlib.import_module(_handler_modules[kind])
+    return _handlers.get(kind)
+
+class JobContext:
+    def __init__(self, job_id: str, resume_from: int):
+        self.id = job_id
+        self.resume_from = resume_from
+
+    def set_total(self, total: Optional[int]):
+        _store.execute("UPDATE jobs SET total = ? WHERE id = ?", (total, self.id))
+
+    def save_params(self, params: dict):
+        # Lets a handler pin what it resolved on its first run (e.g. the
+        # selected items) so a resumed run works on the same input
+        _store.execute("UPDATE jobs SET params = ? WHERE id = ? AND status = 'running'", (json.dumps(params), self.id))
+
+def _job_dict(row) -> dict:
+    job = {
+        "id": row["id"],
+        "kind": row["kind"],
+        "status": row["status"],
+        "total": row["total"],
+        "done": row["done"],
+        "progress": round(row["done"] / row["total"], 4) if row["total"] else None,
+        "error": row["error"],
+        "created_at": row["created_at"],
+        "started_at": row["started_at"],
+        "finished_at": row["finished_at"]
+    }
+    counts = _store.query("SELECT type, COUNT(*) AS n FROM job_records WHERE job_id = ? GROUP BY type", (row["id"],))
+    job["counts"] = {c["type"]: c["n"] for c in counts}
+    return job
+
+def submit_job(kind: str, params: dict, owner: Optional[str] = None) -> dict:
+    if _handler(kind) is None:
+        raise ValueError(f"Unknown job kind '{kind}'")
+    job_id = uuid.uuid4().hex
+    _store.execute(
+        "INSERT INTO jobs (id, kind, owner, params, status, created_at) VALUES (?, ?, ?, ?, 'queued', ?)",
+        (job_id, kind, owner, json.dumps(params), time.time())
+    )
+    _wakeup.set()
+    logger.info(f"Queued {kind} job {job_id}")
+    return get_job(job_id, owner)
+
+def get_job(job_id: str, owner: Optional[str] = None) -> Optional[dict]:
+    # None when the job does not exist or belongs to someone else
+    rows = _store.query("SELECT * FROM jobs WHERE id = ? AND (owner IS NULL OR owner = ?)", (job_id, owner))
+    return _job_dict(rows[0]) if rows else None
+
+def list_jobs(owner: str, status: Optional[str] = None, limit: int = 50) -> list:
+    if status:
+        rows = _store.query(
+            "SELECT * FROM jobs WHERE owner = ? AND status = ? ORDER BY created_at DESC LIMIT ?",
+            (owner, status, limit)
+        )
+    else:
+        rows = _store.query("SELECT * FROM jobs WHERE owner = ? ORDER BY created_at DESC LIMIT ?", (owner, limit))
+    return [_job_dict(row) for row in rows]
+
+def get_records(job_id: str, offset: int = 0, limit: int = 100) -> list:
+    rows = _store.query(
+        "SELECT seq, type, record FROM job_records WHERE job_id = ? AND seq >= ? ORDER BY seq LIMIT ?",
+        (job_id, offset, limit)
+    )
+    return [{"seq": row["seq"], "type": row["type"], **json.loads(row["record"])} for row in rows]
+
+def cancel_job(job_id: str, owner: Optional[str] = None) -> bool:
+    changed = _store.execute(
+        "UPDATE jobs SET status = 'cancelled', finished_at = ? "
+        "WHERE id = ? AND (owner IS NULL OR owner = ?) AND status IN ('queued', 'running')",
+        (time.time(), job_id, owner)
+    )
+    if changed:
+        _cancelled.add(job_id)
+        _scrub_params(job_id)
+    return bool(changed)
+
+def _scrub_params(job_id: str):
+    rows = _store.query("SELECT params FROM jobs WHERE id = ?", (job_id,))
+    if rows:
+        params = {k: v for k, v in json.loads(rows[0]["params"]).items() if k not in SECRET_PARAMS}
+        _store.execute("UPDATE jobs SET params = ? WHERE id = ?", (json.dumps(params), job_id))
+
+def _finish(job_id: str, status: str, error: str = None):
+    _store.execute(
+        "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ? AND status = 'running'",
+        (status, error, time.time(), job_id)
+    )
+    _scrub_params(job_id)
+
+def _claim():
+    # Only kinds this process can run; another instance sharing CACHE_DIR
+    # with other routers enabled picks up the rest
+    kinds = sorted(set(_handlers) | set(_handler_modules))
+    if not kinds:
+        return None
+    with _store.transaction() as conn:
+        row = conn.execute(
+            f"SELECT id, kind, params, done FROM jobs WHERE status = 'queued' AND kind IN ({', '.join('?' * len(kinds))}) "
+            "ORDER BY created_at LIMIT 1",
+            kinds
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute(
+            "UPDATE jobs SET status = 'running', started_at = COALESCE(started_at, ?) WHERE id = ?",
+            (time.time(), row["id"])
+        )
+    return row
+
+def _run(row):
+    job_id = row["id"]
+    job = JobContext(job_id, row["done"])
+    seq = row["done"]
+    logger.info(f"Running {row['kind']} job {job_id} from record {seq}")
+    records = _handler(row["kind"])(json.loads(row["params"]), job)
+    try:
+        for kind, record in records:
+            with _store.transaction() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO job_records (job_id, seq, type, record) VALUES (?, ?, ?, ?)",
+                    (job_id, seq, kind, json.dumps(record))
+                )
+                conn.execute("UPDATE jobs SET done = ? WHERE id = ?", (seq + 1, job_id))
+            seq += 1
+            if job_id in _cancelled:
+                logger.info(f"Job {job_id} cancelled after {seq} records")
+                return
+            if _stopping.is_set():
+                # Hand the job back so the next start resumes it
+                _store.execute("UPDATE jobs SET status = 'queued' WHERE id = ? AND status = 'running'", (job_id,))
+                return
+    except Exception as e:
+        logger.warning(f"Job {job_id} failed: {e}")
+        _finish(job_id, "failed", str(e))
+        return
+    finally:
+        # Stops the handler's own work (e.g. queued extractions)
+        records.close()
+        _cancelled.discard(job_id)
+    _finish(job_id, "completed")
+    logger.info(f"Job {job_id} completed with {seq} records")
+
+def _worker():
+    while not _stopping.is_set():
+        row = _claim()
+        if row is None:
+            _wakeup.wait(timeout=5)
+            _wakeup.clear()
+            continue
+        try:
+            if _handler(row["kind"]) is None:
+                _finish(row["id"], "failed", f"Unknown job kind '{row['kind']}'")
+                continue
+            _run(row)
+        except Exception as e:
+            # The handler failed before producing anything (e.g. bad params)
+            logger.warning(f"Job {row['id']} failed to start: {e}")
+            _finish(row["id"], "failed", str(e))
+
+def start_job_workers():
+    # Jobs left running by a previous process resume from their last record
+    resumed = _store.execute("UPDATE jobs SET status = 'queued' WHERE status = 'running'")
+    if resumed:
+        logger.info(f"Resuming {resumed} interrupted jobs")
+    cutoff = time.time() - JOB_RETENTION
+    with _store.transaction() as conn:
+        conn.execute(
+            "DELETE FROM job_records WHERE job_id IN "
+            "(SELECT id FROM jobs WHERE status IN ('completed', 'failed', 'cancelled') AND finished_at < ?)",
+            (cutoff,)
+        )
+        conn.execute("DELETE FROM jobs WHERE status IN ('completed', 'failed', 'cancelled') AND finished_at < ?", (cutoff,))
+
+    _stopping.clear()
+    for i in range(max(1, JOB_WORKERS)):
+        thread = threading.Thread(target=_worker, name=f"job-worker-{i}", daemon=True)
+        thread.start()
+        _workers.append(thread)
+
+def stop_job_workers(timeout: float = 5):
+    # Workers stop after their current record; anything still running when the
+    # process exits is resumed by the next start_job_workers()
+    _stopping.set()
+    _wakeup.set()
+    for thread in _workers:
+        thread.join(timeout=timeout)
+    _workers.clear()
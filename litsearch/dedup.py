@@ -0,0 +1,174 @@
+import re
+import random
+import logging
+
+# Set up basic logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Records from different sources are the same paper when they share a DOI, a
+# PMID or a normalized title + year fingerprint. The optional near-duplicate
+# pass adds MinHash/LSH over title word bigrams, which only compares records
+# that collide in at least one LSH band, so it stays near-linear. Title and
+# near-duplicate matches never join records whose DOIs or PMIDs disagree, so
+# generic titles ("Correction", "Reply") from the same year stay apart.
+MINHASH_PERMUTATIONS = 32
+LSH_BANDS = 8
+NEAR_DUPLICATE_THRESHOLD = 0.8
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_rng = random.Random(20240519)
+_PERMUTATIONS = [
+    (_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME))
+    for _ in range(MINHASH_PERMUTATIONS)
+]
+
+def normalize_doi(doi):
+    if not doi:
+        return None
+    doi = doi.strip().lower()
+    doi = re.sub(r"^(https?://)?(dx\.)?doi\.org/", "", doi)
+    return doi.removeprefix("doi:") or None
+
+def normalize_title(title):
+    if not title:
+        return ""
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", title.lower()).split())
+
+def record_year(record):
+    date = record.get("pubdate") or record.get("publication_date") or ""
+    match = re.search(r"\b(1[89]|20)\d{2}\b", str(date))
+    return match.group(0) if match else None
+
+def record_identifiers(record) -> dict:
+    identifiers = {}
+    doi = normalize_doi(record.get("doi"))
+    if doi:
+        identifiers["doi"] = doi
+    if record.get("pmid"):
+        identifiers["pmid"] = str(record["pmid"])
+    return identifiers
+
+def record_keys(record):
+    keys = list(record_identifiers(record).items())
+    title = normalize_title(record.get("title"))
+    if title:
+        keys.append(("title", title, record_year(record)))
+    return keys
+
+def _title_shingles(title: str) -> set:
+    words = title.split()
+    if len(words) < 2:
+        return set(words)
+    return {f"{a} {b}" for a, b in zip(words, words[1:])}
+
+def _minhash(shingles: set) -> list:
+    hashes = [hash(s) & _MERSENNE_PRIME for s in shingles]
+    return [min((a * h + b) % _MERSENNE_PRIME for h in hashes) for a, b in _PERMUTATIONS]
+
+class _UnionFind:
+    # identifiers[i]: record i's DOI/PMID (see record_identifiers); each root
+    # holds the identifiers of its whole group
+    def __init__(self, identifiers: list):
+        self.parent = list(range(len(identifiers)))
+        self.identifiers = [{name: {value} for name, value in ids.items()} for ids in identifiers]
+
+    def find(self, i: int) -> int:
+        while self.parent[i] != i:
+            self.parent[i] = self.parent[self.parent[i]]
+            i = self.parent[i]
+        return i
+
+    def union(self, a: int, b: int):
+        a, b = self.find(a), self.find(b)
+        if a != b:
+            # Keep the earlier record as the root so merges favour source order
+            root, child = min(a, b), max(a, b)
+            self.parent[child] = root
+            for name, values in self.identifiers[child].items():
+                self.identifiers[root].setdefault(name, set()).update(values)
+
+    def conflicts(self, a: int, b: int) -> bool:
+        # Both groups carry a DOI (or a PMID) and none of them is shared
+        ids_a, ids_b = self.identifiers[self.find(a)], self.identifiers[self.find(b)]
+        return any(name in ids_b and not values & ids_b[name] for name, values in ids_a.items())
+
+def _link_near_duplicates(records: list, groups: _UnionFind, threshold: float):
+    rows = MINHASH_PERMUTATIONS // LSH_BANDS
+    shingles = [_title_shingles(normalize_title(r.get("title"))) for r in records]
+    buckets = {}
+    for i, s in enumerate(shingles):
+        if not s:
+            continue
+        signature = _minhash(s)
+        for band in range(LSH_BANDS):
+            key = (band, tuple(signature[band * rows:(band + 1) * rows]))
+            buckets.setdefault(key, []).append(i)
+
+    checked = set()
+    for members in buckets.values():
+        for pos, i in enumerate(members):
+            for j in members[pos + 1:]:
+                if (i, j) in checked or groups.find(i) == groups.find(j):
+                    continue
+                checked.add((i, j))
+                year_i, year_j = record_year(records[i]), record_year(records[j])
+                if (year_i and year_j and year_i != year_j) or groups.conflicts(i, j):
+                    continue
+                a, b = shingles[i], shingles[j]
+                if len(a & b) / len(a | b) >= threshold:
+                    groups.union(i, j)
+
+def merge_records(records: list) -> dict:
+    # Fields from earlier records win; later records only fill gaps
+    merged = {}
+    sources = []
+    for record in records:
+        source = record.get("source", "pubmed")
+        if source not in sources:
+            sources.append(source)
+        for field, value in record.items():
+            if field == "source":
+                continue
+            if merged.get(field) in (None, "", []) and value not in (None, "", []):
+                merged[field] = value
+    merged["sources"] = sources
+    return merged
+
+def deduplicate(records: list, near_duplicates: bool = False, threshold: float = NEAR_DUPLICATE_THRESHOLD) -> list:
+    groups = _UnionFind([record_identifiers(r) for r in records])
+    keys = [record_keys(r) for r in records]
+    # DOI/PMID matches first, so title matches see the identifiers of the
+    # whole group they would join
+    owner = {}
+    for i, record_key_list in enumerate(keys):
+        for key in record_key_list:
+            if key[0] == "title":
+                continue
+            if key in owner:
+                groups.union(owner[key], i)
+            else:
+                owner[key] = i
+    # A title key can name several unrelated papers; join the first group
+    # with that title that does not conflict
+    owners = {}
+    for i, record_key_list in enumerate(keys):
+        for key in record_key_list:
+            if key[0] != "title":
+                continue
+            candidates = owners.setdefault(key, [])
+            match = next((j for j in candidates if not groups.conflicts(j, i)), None)
+            if match is None:
+                candidates.append(i)
+            else:
+                groups.union(match, i)
+
+    if near_duplicates:
+        _link_near_duplicates(records, groups, threshold)
+
+    clusters = {}
+    for i in range(len(records)):
+        clusters.setdefault(groups.find(i), []).append(records[i])
+    merged = [merge_records(members) for _, members in sorted(clusters.items())]
+    logger.info(f"Deduplicated {len(records)} records into {len(merged)}")
+    return merged
@@ -1,7 +1,16 @@
 from fastapi import APIRouter
-from fastapi import Query
-from clients.pubmed_client import search_pubmed, fetch_pubmed_details
-from clients.embase_client import search_scopus, search_sciencedirect
+from fastapi import HTTPException, Query, Response
+from concurrent.futures import ThreadPoolExecutor, wait
+import os
+import time
+import sqlite3
+from clients.pubmed_client import cached_search_pubmed, fetch_pubmed_details, fetch_pubmed_batch
+from clients.embase_client import cached_search_scopus, cached_search_sciencedirect
+from clients.http import deadline
+from clients.zotero_client import library_id
+from litsearch.dedup import deduplicate
+from clients import search_index
+from typing import Optional
 import logging
 
 # Set up basic logging
@@ -10,29 +19,128 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# Each upstream source runs on its own worker so the endpoint waits for the
+# slowest source instead of the sum of all of them.
+SOURCE_TIMEOUT = float(os.getenv("LITSEARCH_SOURCE_TIMEOUT", "20"))
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("LITSEARCH_MAX_WORKERS", "16")),
+    thread_name_prefix="litsearch"
+)
+
+# Every source returns (results, cache_status)
+def _search_pubmed_source(query: str, retmax: int, batch: bool = False):
+    if batch:
+        # Pull every hit through the History server; retmax does not apply
+        return fetch_pubmed_batch(query=query), "BYPASS"
+    pmids, cache_status = cached_search_pubmed(query, retmax)
+    return (fetch_pubmed_details(pmids) if pmids else []), cache_status
+
+SOURCES = {
+    "pubmed": _search_pubmed_source,
+    "scopus": lambda query, retmax, batch: cached_search_scopus(query, count=retmax),
+    "sciencedirect": lambda query, retmax, batch: cached_search_sciencedirect(query, count=retmax),
+}
+
+def _run_source(name: str, expires_at: float, query: str, retmax: int, batch: bool):
+    # Upstream timeouts and retries are capped at what is left of the
+    # request's deadline, so a source that misses it gives its worker back
+    # soon after instead of running on (e.g. through a whole History pull)
+    with deadline(expires_at - time.monotonic()):
+        return SOURCES[name](query, retmax, batch)
+
 @router.get("/search")
-def multi_database_search(query: str, databases: list[str] = Query(default=["pubmed"]), retmax: int = 10):
+def multi_database_search(
+    response: Response,
+    query: str,
+    databases: list[str] = Query(default=["pubmed"]),
+    retmax: int = 10,
+    batch: bool = False,
+    timeout: float = SOURCE_TIMEOUT,
+    dedupe: bool = True,
+    near_duplicates: bool = False
+):
     logger.info(f"Received search query: '{query}' | Databases: {databases}")
-    all_results = []
+    started = time.monotonic()
 
-    if "pubmed" in databases:
-        pmids = search_pubmed(query, retmax)
-        pubmed_results = fetch_pubmed_details(pmids)
-        logger.info(f"PubMed returned {len(pubmed_results)} results.")
-        all_results.extend(pubmed_results)
+    futures = {}
+    sources = {}
+    for name in databases:
+        if name in futures or name in sources:
+            continue
+        if name not in SOURCES:
+            sources[name] = {"status": "error", "error": f"Unknown database '{name}'", "count": 0}
+            continue
+        futures[name] = _executor.submit(_run_source, name, started + timeout, query, retmax, batch)
 
-    if "scopus" in databases:
-        scopus_results = search_scopus(query, count=retmax)
-        logger.info(f"Scopus returned {len(scopus_results)} results.")
-        all_results.extend(scopus_results)
+    # Wait for every source up to the shared deadline; whatever is still
+    # running is reported as timed out, its results are dropped and its
+    # upstream calls give up at the same deadline (see _run_source).
+    wait(futures.values(), timeout=timeout)
 
-    if "sciencedirect" in databases:
-        sd_results = search_sciencedirect(query, count=retmax)
-        logger.info(f"ScienceDirect returned {len(sd_results)} results.")
-        all_results.extend(sd_results)
+    all_results = []
+    for name, future in futures.items():
+        if not future.done():
+            future.cancel()
+            logger.warning(f"{name} did not answer within {timeout}s")
+            sources[name] = {"status": "timeout", "count": 0}
+            continue
+        try:
+            results, cache_status = future.result()
+        except Exception as e:
+            logger.warning(f"{name} search failed: {e}")
+            sources[name] = {"status": "error", "error": str(e), "count": 0}
+            continue
+        logger.info(f"{name} returned {len(results)} results.")
+        sources[name] = {"status": "ok", "count": len(results), "cache": cache_status}
+        all_results.extend(results)
+
+    # Merge the same paper found by several sources (DOI, PMID or title + year,
+    # optionally fuzzy title matches) into one record listing all sources
+    total_found = len(all_results)
+    if dedupe:
+        all_results = deduplicate(all_results, near_duplicates=near_duplicates)
 
-    logger.info(f"Total combined results: {len(all_results)}")
+    cache_status = ", ".join(f"{name}={info['cache']}" for name, info in sources.items() if "cache" in info)
+    if cache_status:
+        response.headers["X-Cache-Status"] = cache_status
+    elapsed_ms = round((time.monotonic() - started) * 1000)
+    logger.info(f"Total combined results: {len(all_results)} in {elapsed_ms} ms")
     return {
         "count": len(all_results),
+        "duplicates_removed": total_found - len(all_results),
+        "sources": sources,
+        "elapsed_ms": elapsed_ms,
         "results": all_results
-    }
\ No newline at end of file
+    }
+
+@router.get("/local")
+def local_search(
+    q: str,
+    kind: Optional[str] = Query(default=None, pattern="^(pubmed|elsevier|pdf_page)$"),
+    limit: int = Query(default=20, ge=1, le=100),
+    offset: int = Query(default=0, ge=0),
+    raw: bool = False,
+    user_id: Optional[str] = None,
+    api_key: Optional[str] = None
+):
+    # Ranked (BM25) search over everything already fetched: PubMed abstracts,
+    # Elsevier full texts and extracted Zotero PDF pages. No upstream calls.
+    # raw=true passes q through as an FTS5 query (phrases, OR, NEAR, prefix*).
+    # PDF pages are private: they are only searched with the Zotero user_id
+    # and api_key they were extracted with.
+    if kind == "pdf_page" and not (user_id and api_key):
+        raise HTTPException(status_code=422, detail="kind=pdf_page requires user_id and api_key.")
+    library = library_id(user_id, api_key) if user_id and api_key else None
+    started = time.monotonic()
+    try:
+        found = search_index.search(q, limit=limit, offset=offset, kind=kind, raw=raw, library=library)
+    except sqlite3.OperationalError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid search query: {e}")
+    return {
+        "query": q,
+        "total": found["total"],
+        "offset": offset,
+        "count": len(found["results"]),
+        "elapsed_ms": round((time.monotonic() - started) * 1000),
+        "results": found["results"]
+    }
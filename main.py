@@ -1,37 +1,171 @@
-from fastapi import FastAPI
+import time
+_started = time.perf_counter()
+
+from contextlib import asynccontextmanager
+import os
+import sys
+import json
+import importlib
+import threading
+from fastapi import FastAPI, Request
+from fastapi.responses import PlainTextResponse
 from fastapi.openapi.utils import get_openapi
-from pubmed.main import router as pubmed_router
-from embase.main import router as embase_router
-from zotero.main import router as zotero_router
-from litsearch.main import router as litsearch_router
+from starlette.concurrency import run_in_threadpool
+from clients import metrics
+from clients.http import open_sessions, close_sessions
+from jobs.runner import declare_job, start_job_workers, stop_job_workers
 import logging
 
 # Set up basic logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Literature Tools API", version="1.0.0")
+# name -> (module, prefix, tag). ENABLED_ROUTERS (comma-separated names)
+# limits which are served; an unknown name stops startup. With
+# LAZY_ROUTERS=1 a router's module, and with it its client libraries, is
+# imported on the first request under its prefix instead of at startup;
+# /openapi.json then needs every router, so pair it with a prebuilt schema
+# (OPENAPI_SCHEMA_PATH, written by `python main.py`).
+ROUTERS = {
+    "pubmed": ("pubmed.main", "/pubmed", "PubMed"),
+    "embase": ("embase.main", "/embase", "Embase"),
+    "zotero": ("zotero.main", "/zotero", "Zotero"),
+    "litsearch": ("litsearch.main", "/litsearch", "LitSearch"),
+    "jobs": ("jobs.main", "/jobs", "Jobs"),
+}
+ENABLED_ROUTERS = [
+    name.strip() for name in os.getenv("ENABLED_ROUTERS", ",".join(ROUTERS)).split(",")
+    if name.strip()
+]
+_unknown_routers = [name for name in ENABLED_ROUTERS if name not in ROUTERS]
+if _unknown_routers:
+    raise ValueError(f"Unknown ENABLED_ROUTERS {_unknown_routers}; known routers: {', '.join(ROUTERS)}")
+LAZY_ROUTERS = os.getenv("LAZY_ROUTERS", "0").lower() in ("1", "true", "yes")
+OPENAPI_SCHEMA_PATH = os.getenv("OPENAPI_SCHEMA_PATH")
+
+# Background job kind -> the router that submits it. Job handlers register
+# themselves when their module is imported; declaring them lets a resumed job
+# load its module even if no request has yet. Only enabled routers' jobs are
+# declared, and job workers only start if there are any.
+JOB_KINDS = {"pubmed_fetch": "pubmed", "zotero_extraction": "zotero"}
+ENABLED_JOBS = [kind for kind, router in JOB_KINDS.items() if router in ENABLED_ROUTERS]
+for _kind in ENABLED_JOBS:
+    declare_job(_kind, ROUTERS[JOB_KINDS[_kind]][0])
+
+# Startup profile: (phase, milliseconds), logged once startup completes and
+# served on /startup_profile
+startup_profile = []
+
+def _record_phase(name: str, since: float) -> float:
+    now = time.perf_counter()
+    startup_profile.append((name, round((now - since) * 1000, 1)))
+    return now
+
+_record_phase("core imports", _started)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Upstream connection pools live for the lifetime of the app
+    started = time.perf_counter()
+    open_sessions()
+    started = _record_phase("open HTTP pools", started)
+    if ENABLED_JOBS:
+        start_job_workers()
+        _record_phase("start job workers", started)
+    total = round((time.perf_counter() - _started) * 1000, 1)
+    logger.info(
+        f"Startup profile ({'lazy' if LAZY_ROUTERS else 'eager'} routers, {total} ms): "
+        + ", ".join(f"{name} {ms} ms" for name, ms in startup_profile)
+    )
+    yield
+    stop_job_workers()
+    if "zotero.pipeline" in sys.modules:
+        # Only loaded once an extraction has run
+        sys.modules["zotero.pipeline"].shutdown_executors()
+    close_sessions()
+
+app = FastAPI(title="Literature Tools API", version="1.0.0", lifespan=lifespan)
+
+@app.middleware("http")
+async def record_latency(request: Request, call_next):
+    # Labelled by endpoint function, not raw path, to keep the label set bounded
+    started = time.perf_counter()
+    response = await call_next(request)
+    endpoint = request.scope.get("endpoint")
+    metrics.HTTP_REQUEST_SECONDS.observe(
+        time.perf_counter() - started,
+        method=request.method,
+        endpoint=f"{endpoint.__module__}.{endpoint.__name__}" if endpoint else "unmatched",
+        status=response.status_code
+    )
+    return response
+
+@app.get("/metrics", include_in_schema=False)
+def metrics_endpoint():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/startup_profile", include_in_schema=False)
+def startup_profile_endpoint():
+    return {
+        "lazy_routers": LAZY_ROUTERS,
+        "enabled_routers": ENABLED_ROUTERS,
+        "loaded_routers": [name for name in ENABLED_ROUTERS if ROUTERS[name][0] in sys.modules],
+        "phases_ms": dict(startup_profile),
+        "total_ms": round(sum(ms for _, ms in startup_profile), 1)
+    }
+
+class LazyRouter:
+    # ASGI app mounted at a router's prefix that imports the router on its
+    # first request and serves it from a bare sub-application
+    def __init__(self, name: str):
+        self.name = name
+        self._app = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._app is None:
+                started = time.perf_counter()
+                module, _, tag = ROUTERS[self.name]
+                sub_app = FastAPI(openapi_url=None, docs_url=None, redoc_url=None)
+                sub_app.include_router(importlib.import_module(module).router, tags=[tag])
+                self._app = sub_app
+                logger.info(f"Loaded {self.name} routes on first use in {(time.perf_counter() - started) * 1000:.0f} ms")
+        return self._app
+
+    async def __call__(self, scope, receive, send):
+        sub_app = self._app or await run_in_threadpool(self._load)
+        await sub_app(scope, receive, send)
+
+def include_routers(target: FastAPI, lazy: bool = False):
+    for name in ENABLED_ROUTERS:
+        module, prefix, tag = ROUTERS[name]
+        if lazy:
+            target.mount(prefix, LazyRouter(name))
+            continue
+        started = time.perf_counter()
+        target.include_router(importlib.import_module(module).router, prefix=prefix, tags=[tag])
+        if target is app:
+            _record_phase(f"{name} router", started)
+            logger.info(f"Registered {tag} routes at {prefix}")
 
 # Include routes
-app.include_router(pubmed_router, prefix="/pubmed", tags=["PubMed"])
-logger.info("Registered PubMed routes at /pubmed")
-app.include_router(embase_router, prefix="/embase", tags=["Embase"])
-logger.info("Registered Embase routes at /embase")
-app.include_router(zotero_router, prefix="/zotero", tags=["Zotero"])
-logger.info("Registered Zotero routes at /zotero")
-app.include_router(litsearch_router, prefix="/litsearch", tags=["LitSearch"])  # NEW
-logger.info("Registered LitSearch routes at /litsearch")
+include_routers(app, lazy=LAZY_ROUTERS)
 
 # Custom OpenAPI schema with 'servers' field and patched response for extract_chunks
-def custom_openapi():
-    if app.openapi_schema:
-        return app.openapi_schema
+def build_openapi_schema():
+    routes = app.routes
+    if LAZY_ROUTERS:
+        # Mounted lazy routers are invisible to the schema generator
+        schema_app = FastAPI()
+        include_routers(schema_app)
+        routes = schema_app.routes
 
     openapi_schema = get_openapi(
         title=app.title,
         version=app.version,
         description="API to access PubMed and Zotero tools",
-        routes=app.routes,
+        routes=routes,
     )
 
     openapi_schema["servers"] = [
@@ -39,11 +173,11 @@ def custom_openapi():
     ]
 
     # Patch the extract_chunks_from_collection response schema
-    path = "/zotero/extract_chunks_from_collection"
+    path = "/zotero/zotero/extract_chunks_from_collection"
     method = "get"
     if path in openapi_schema["paths"]:
         openapi_schema["paths"][path][method]["responses"]["200"] = {
-            "description": "Returns full-text sections extracted from each PDF",
+            "description": "Returns the text of each PDF, or section -> chunks with by_section/sections",
             "content": {
                 "application/json": {
                     "schema": {
@@ -57,6 +191,9 @@ def custom_openapi():
                                     "properties": {
                                         "title": {"type": "string"},
                                         "key": {"type": "string"},
+                                        "page_count": {"type": "integer"},
+                                        "page_range": {"type": "array", "items": {"type": "integer"}},
+                                        "text": {"type": "string"},
                                         "sections": {
                                             "type": "object",
                                             "additionalProperties": {
@@ -83,8 +220,27 @@ def custom_openapi():
             }
         }
 
-    app.openapi_schema = openapi_schema
+    return openapi_schema
+
+def custom_openapi():
+    # A schema prebuilt at deploy time (`python main.py openapi.json`) is
+    # served as is; otherwise it is generated on the first request
+    if app.openapi_schema:
+        return app.openapi_schema
+    if OPENAPI_SCHEMA_PATH and os.path.exists(OPENAPI_SCHEMA_PATH):
+        with open(OPENAPI_SCHEMA_PATH) as f:
+            app.openapi_schema = json.load(f)
+    else:
+        app.openapi_schema = build_openapi_schema()
     return app.openapi_schema
 
 app.openapi = custom_openapi
 logger.info("Custom OpenAPI schema set.")
+
+if __name__ == "__main__":
+    # Build step: write the OpenAPI schema for OPENAPI_SCHEMA_PATH
+    output = sys.argv[1] if len(sys.argv) > 1 else "openapi.json"
+    schema = build_openapi_schema()
+    with open(output, "w") as f:
+        json.dump(schema, f)
+    logger.info(f"Wrote OpenAPI schema with {len(schema['paths'])} paths to {output}")
@@ -1,8 +1,20 @@
-from fastapi import APIRouter, Query
-import requests
-import xml.etree.ElementTree as ET
+from fastapi import APIRouter, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
+from typing import Optional
+import json
 import logging
-from clients.pubmed_client import search_pubmed, fetch_pubmed_details
+from clients.pubmed_client import (
+    BATCH_SIZE,
+    cached_search_pubmed,
+    fetch_pubmed_details,
+    fetch_pubmed_batch,
+    fetch_pubmed_summaries,
+    iter_pubmed_details,
+    iter_pubmed_batch,
+    iter_pubmed_history,
+    search_pubmed_history
+)
+from jobs.runner import register_job, submit_job
 
 # Set up basic logging
 logging.basicConfig(level=logging.INFO)
@@ -10,44 +22,113 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-PUBMED_EUTILS_BASE = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils"
-
 @router.get("/search")
-def search_pubmed_endpoint(query: str, retmax: int = 10):
-    id_list = search_pubmed(query, retmax)
+def search_pubmed_endpoint(response: Response, query: str, retmax: int = 10):
+    id_list, cache_status = cached_search_pubmed(query, retmax)
+    response.headers["X-Cache-Status"] = cache_status
     results = [{"pmid": pmid, "link": f"https://pubmed.ncbi.nlm.nih.gov/{pmid}/"} for pmid in id_list]
     logger.info(f"Search query: {query} | Returned {len(results)} PMIDs")
     return results
 
 @router.get("/summary")
 def get_summary(pmids: list[str] = Query(...)):
-    url = f"{PUBMED_EUTILS_BASE}/esummary.fcgi"
-    params = {
-        "db": "pubmed",
-        "retmode": "json",
-        "id": ",".join(pmids)
-    }
-    response = requests.get(url, params=params)
-    response.raise_for_status()
-
-    summaries = []
-    result = response.json()["result"]
-    for pmid in pmids:
-        if pmid in result:
-            doc = result[pmid]
-            summaries.append({
-                "pmid": pmid,
-                "title": doc.get("title"),
-                "authors": ", ".join([a["name"] for a in doc.get("authors", [])]),
-                "source": doc.get("source"),
-                "pubdate": doc.get("pubdate"),
-                "link": f"https://pubmed.ncbi.nlm.nih.gov/{pmid}/"
-            })
-    logger.info(f"Summarizing PMIDs: {pmids} | Returned {len(summaries)} summaries")
+    summaries = fetch_pubmed_summaries(pmids)
+    logger.info(f"Summarizing {len(pmids)} PMIDs | Returned {len(summaries)} summaries")
     return summaries
 
 @router.get("/fetch")
-def fetch_pubmed_details_endpoint(pmids: list[str] = Query(...)):
-    results = fetch_pubmed_details(pmids)
-    logger.info(f"Fetched details for PMIDs: {pmids} | Returned {len(results)} articles")
-    return results
\ No newline at end of file
+def fetch_pubmed_details_endpoint(
+    pmids: Optional[list[str]] = Query(default=None),
+    query: Optional[str] = None,
+    batch: bool = False,
+    retmax: Optional[int] = None,
+    chunk_size: int = Query(default=BATCH_SIZE, ge=1, le=10000)
+):
+    # batch=true (or a query) goes through the History server and is not
+    # limited by retmax unless one is given
+    if query:
+        results = fetch_pubmed_batch(query=query, max_records=retmax, chunk_size=chunk_size)
+    elif not pmids:
+        raise HTTPException(status_code=422, detail="Provide pmids or query.")
+    elif batch:
+        results = fetch_pubmed_batch(pmids=pmids, max_records=retmax, chunk_size=chunk_size)
+    else:
+        results = fetch_pubmed_details(pmids, chunk_size=chunk_size)
+    logger.info(f"Fetched details for {len(pmids or [])} PMIDs / query={query!r} | Returned {len(results)} articles")
+    return results
+
+@router.get("/fetch/stream")
+def stream_pubmed_details_endpoint(
+    pmids: Optional[list[str]] = Query(default=None),
+    query: Optional[str] = None,
+    batch: bool = False,
+    retmax: Optional[int] = None,
+    chunk_size: int = Query(default=BATCH_SIZE, ge=1, le=10000)
+):
+    # Same selection as /fetch, but every article is written as one NDJSON
+    # line as soon as it has been parsed out of the efetch response. A PMID
+    # list comes back in request order.
+    if query:
+        articles = iter_pubmed_batch(query=query, max_records=retmax, chunk_size=chunk_size)
+    elif not pmids:
+        raise HTTPException(status_code=422, detail="Provide pmids or query.")
+    elif batch:
+        articles = iter_pubmed_batch(pmids=pmids, max_records=retmax, chunk_size=chunk_size)
+    else:
+        articles = iter_pubmed_details(pmids, chunk_size=chunk_size)
+
+    def ndjson():
+        # The status is sent before the first article, so a failure part way
+        # through ends the stream with an "error" line instead of cutting it
+        count = 0
+        try:
+            for article in articles:
+                count += 1
+                yield json.dumps(article) + "\n"
+        except Exception as e:
+            logger.warning(f"PubMed stream failed after {count} articles: {e}")
+            yield json.dumps({"type": "error", "error": str(e), "count": count}) + "\n"
+            return
+        logger.info(f"Streamed {count} articles for {len(pmids or [])} PMIDs / query={query!r}")
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+def pubmed_fetch_job(params: dict, job):
+    # Background version of /fetch. A query walks its History server result
+    # set from job.resume_from; a PMID list is fetched in input order with a
+    # "skipped" record for every PMID PubMed does not return.
+    chunk_size = params["chunk_size"]
+    if params.get("query"):
+        history = search_pubmed_history(params["query"])
+        total = history["count"] if params.get("retmax") is None else min(history["count"], params["retmax"])
+        job.set_total(total)
+        for article in iter_pubmed_history(history, job.resume_from, params.get("retmax"), chunk_size):
+            yield "result", article
+        return
+
+    pmids = list(dict.fromkeys(params["pmids"]))[:params.get("retmax")]
+    job.set_total(len(pmids))
+    remaining = pmids[job.resume_from:]
+    for start in range(0, len(remaining), chunk_size):
+        chunk = remaining[start:start + chunk_size]
+        found = {article["pmid"]: article for article in fetch_pubmed_details(chunk, chunk_size=chunk_size)}
+        for pmid in chunk:
+            if pmid in found:
+                yield "result", found[pmid]
+            else:
+                yield "skipped", {"pmid": pmid, "reason": "Not returned by PubMed"}
+
+register_job("pubmed_fetch", pubmed_fetch_job)
+
+@router.post("/fetch/jobs", status_code=202)
+def submit_pubmed_fetch_job(
+    pmids: Optional[list[str]] = Query(default=None),
+    query: Optional[str] = None,
+    retmax: Optional[int] = None,
+    chunk_size: int = Query(default=BATCH_SIZE, ge=1, le=10000)
+):
+    # Same selection as /fetch, run as a background job; poll /jobs/{id} or
+    # stream /jobs/{id}/stream for progress and results
+    if not pmids and not query:
+        raise HTTPException(status_code=422, detail="Provide pmids or query.")
+    return submit_job("pubmed_fetch", {"pmids": pmids, "query": query, "retmax": retmax, "chunk_size": chunk_size})
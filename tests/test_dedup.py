@@ -0,0 +1,66 @@
+from litsearch.dedup import deduplicate
+
+def pmids(merged):
+    return sorted(r.get("pmid") or "" for r in merged)
+
+def test_doi_match_merges_across_sources():
+    merged = deduplicate([
+        {"source": "pubmed", "pmid": "1", "doi": "10.1000/ABC", "title": "Radiomics of the spine", "pubdate": "2021"},
+        {"source": "scopus", "doi": "https://doi.org/10.1000/abc", "title": "Radiomics of the spine.", "citations": 4},
+    ])
+    assert len(merged) == 1
+    assert merged[0]["sources"] == ["pubmed", "scopus"]
+    assert merged[0]["pmid"] == "1"
+    assert merged[0]["citations"] == 4
+
+def test_pmid_match_merges_without_doi():
+    merged = deduplicate([
+        {"source": "pubmed", "pmid": "7", "title": "A title"},
+        {"source": "sciencedirect", "pmid": 7, "title": "A different rendering of the title"},
+    ])
+    assert len(merged) == 1
+    assert merged[0]["sources"] == ["pubmed", "sciencedirect"]
+
+def test_title_and_year_merge_when_identifiers_agree():
+    merged = deduplicate([
+        {"source": "pubmed", "pmid": "3", "title": "Deep learning for spinal metastasis", "pubdate": "2022 Mar"},
+        {"source": "scopus", "doi": "10.1/x", "title": "Deep Learning for Spinal Metastasis", "publication_date": "2022-03-01"},
+    ])
+    assert len(merged) == 1
+    assert merged[0]["doi"] == "10.1/x"
+
+def test_generic_titles_with_different_identifiers_stay_apart():
+    merged = deduplicate([
+        {"source": "pubmed", "pmid": "1", "doi": "10.1/a", "title": "Correction", "pubdate": "2021"},
+        {"source": "pubmed", "pmid": "2", "doi": "10.1/b", "title": "Correction", "pubdate": "2021"},
+        {"source": "scopus", "doi": "10.1/c", "title": "Correction", "publication_date": "2021-05-01"},
+    ])
+    assert len(merged) == 3
+    assert pmids(merged) == ["", "1", "2"]
+
+def test_conflicting_pmids_stay_apart_even_with_shared_title():
+    merged = deduplicate([
+        {"source": "pubmed", "pmid": "1", "title": "Reply", "pubdate": "2020"},
+        {"source": "pubmed", "pmid": "2", "title": "Reply", "pubdate": "2020"},
+    ])
+    assert pmids(merged) == ["1", "2"]
+
+def test_title_match_joins_the_non_conflicting_group():
+    merged = deduplicate([
+        {"source": "pubmed", "pmid": "1", "doi": "10.1/a", "title": "Editorial", "pubdate": "2021"},
+        {"source": "pubmed", "pmid": "2", "doi": "10.1/b", "title": "Editorial", "pubdate": "2021"},
+        {"source": "scopus", "doi": "10.1/b", "title": "Editorial", "publication_date": "2021"},
+        {"source": "sciencedirect", "title": "Editorial", "publication_date": "2021"},
+    ])
+    assert len(merged) == 2
+    assert merged[1]["sources"] == ["pubmed", "scopus"]
+
+def test_near_duplicates_respect_conflicting_identifiers():
+    records = [
+        {"source": "pubmed", "pmid": "10", "title": "Outcomes after surgery for spinal metastases in older adults", "pubdate": "2019"},
+        {"source": "scopus", "title": "Outcomes after surgery for spinal metastases in older adults: a cohort", "publication_date": "2019"},
+        {"source": "pubmed", "pmid": "11", "title": "Outcomes after surgery for spinal metastases in older adults a cohort", "pubdate": "2019"},
+    ]
+    merged = deduplicate(records, near_duplicates=True, threshold=0.7)
+    assert len(merged) == 2
+    assert pmids(merged) == ["10", "11"]
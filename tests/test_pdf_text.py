@@ -0,0 +1,100 @@
+import json
+import pytest
+from zotero.pdf_text import chunk_sections, extract_pdf_sections
+
+STRUCTURED_ABSTRACT = """Radiomics of spinal metastases
+Abstract
+Background: Spinal metastases are common.
+Methods: We enrolled 120 patients in a
+prospective cohort.
+Results: Accuracy was 0.91.
+Conclusions: Radiomics helps.
+1. Introduction
+Metastatic disease of the spine is frequent.
+2. Methods
+Patients were scanned on a 3T scanner using
+methods described previously by our group.
+Segmentation was manual.
+3. Results
+results of segmentation are shown in Table 1.
+4. Discussion
+We found good agreement.
+References
+1. Smith J."""
+
+def test_structured_abstract_labels_stay_in_abstract():
+    sections = chunk_sections([STRUCTURED_ABSTRACT])
+    abstract = "\n".join(sections["abstract"])
+    assert "Methods: We enrolled 120 patients in a" in abstract
+    assert "Results: Accuracy was 0.91." in abstract
+    assert list(sections) == ["preamble", "abstract", "introduction", "methods", "results", "discussion", "references"]
+
+def test_sections_filter_reaches_real_methods():
+    sections = chunk_sections([STRUCTURED_ABSTRACT], sections=["methods"])
+    assert sections == {"methods": [
+        "Patients were scanned on a 3T scanner using\n"
+        "methods described previously by our group.\n"
+        "Segmentation was manual."
+    ]}
+
+def test_wrapped_body_lines_are_not_headings():
+    sections = chunk_sections([STRUCTURED_ABSTRACT])
+    assert "methods described previously by our group." in sections["methods"][0]
+    assert sections["results"] == ["results of segmentation are shown in Table 1."]
+
+def test_label_lines_inside_abstract():
+    text = "Abstract\nBackground:\nWhy.\nMethods:\nHow.\nResults:\nWhat.\nIntroduction\nIntro.\nMethods\nReal methods."
+    sections = chunk_sections([text], sections=["methods"])
+    assert sections == {"methods": ["Real methods."]}
+
+def test_bare_labels_inside_abstract_do_not_stop_early():
+    text = "Abstract\nBackground\nWhy.\nMethods\nHow.\nIntroduction\nI\nMethods\nReal methods.\nResults\nR"
+    assert chunk_sections([text], sections=["methods"]) == {"methods": ["Real methods."]}
+
+def test_bare_abstract_label_kept_without_a_later_section():
+    text = "Abstract\nBackground\nWhy.\nMethods\nHow.\nIntroduction\nI"
+    assert chunk_sections([text], sections=["methods"]) == {"methods": ["How."]}
+
+def test_lowercase_single_word_line_is_body():
+    sections = chunk_sections(["Methods\nWe compared the\nresults.\nDiscussion\nDone."])
+    assert sections["methods"] == ["We compared the\nresults."]
+
+def test_early_stop_across_pages():
+    pages = ["Introduction\nIntro text.", "Methods\nMethod text.", "Results\nResult text.", "Discussion\nNever parsed."]
+    assert chunk_sections(pages, sections=["methods"]) == {"methods": ["Method text."]}
+
+def test_chunks_respect_max_chunk_chars():
+    body = "\n".join(f"Line {i} of the methods." for i in range(20))
+    sections = chunk_sections([f"Methods\n{body}"], max_chunk_chars=100)
+    assert all(len(chunk) <= 100 for chunk in sections["methods"])
+    assert "\n".join(sections["methods"]) == body
+
+def styled_pdf() -> bytes:
+    fitz = pytest.importorskip("fitz")
+    doc = fitz.open()
+    page = doc.new_page()
+    y = 72
+    for text, size, font in [
+        ("Methods", 14, "hebo"),
+        ("We describe the pipeline; the figure caption reads", 10, "helv"),
+        ("Results", 10, "helv"),
+        ("and continues here.", 10, "helv"),
+        ("Results", 14, "hebo"),
+        ("Accuracy was high.", 10, "helv"),
+    ]:
+        page.insert_text((72, y), text, fontsize=size, fontname=font)
+        y += 20
+    return doc.tobytes()
+
+def test_font_information_rejects_body_type_headings():
+    result = extract_pdf_sections(styled_pdf())
+    assert result["sections"]["methods"] == [
+        "We describe the pipeline; the figure caption reads\nResults\nand continues here."
+    ]
+    assert result["sections"]["results"] == ["Accuracy was high."]
+
+def test_stored_lines_chunk_like_a_fresh_extraction():
+    result = extract_pdf_sections(styled_pdf())
+    stored_lines = json.loads(json.dumps(result["lines"]))
+    assert chunk_sections(result["pages"], lines=stored_lines) == result["sections"]
+    assert chunk_sections(result["pages"]) != result["sections"]
@@ -0,0 +1,122 @@
+import time
+import pytest
+import requests
+from clients import http, throttle
+from clients.throttle import CircuitBreaker, TokenBucket, UpstreamUnavailable
+
+class FakeResponse:
+    def __init__(self, status_code: int):
+        self.status_code = status_code
+        self.headers = {}
+        self.content = b""
+
+    def close(self):
+        pass
+
+class FakeSession:
+    # Plays back a list of responses (status codes) and exceptions
+    def __init__(self, outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def request(self, method, url, **kwargs):
+        self.calls += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return FakeResponse(outcome)
+
+@pytest.fixture
+def upstream(monkeypatch):
+    # An upstream without a rate limit, a fresh breaker and no retry delays
+    monkeypatch.setenv("FAKE_RETRY_BASE_DELAY", "0")
+    monkeypatch.setenv("FAKE_CIRCUIT_FAILURES", "2")
+    monkeypatch.setenv("FAKE_MAX_RETRIES", "3")
+    throttle._breakers.pop("fake", None)
+    yield "fake"
+    throttle._breakers.pop("fake", None)
+
+def use_session(monkeypatch, outcomes) -> FakeSession:
+    session = FakeSession(outcomes)
+    monkeypatch.setattr(http, "get_session", lambda upstream: session)
+    return session
+
+def expire(breaker: CircuitBreaker):
+    breaker.opened_at = time.monotonic() - breaker.reset_timeout
+
+def test_breaker_opens_after_threshold_and_fails_fast():
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=30)
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(UpstreamUnavailable):
+        breaker.before_call()
+
+def test_breaker_half_open_trial_closes_on_success():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    expire(breaker)
+    assert breaker.state == "half-open"
+    assert breaker.before_call() is True
+    # Only one trial at a time
+    with pytest.raises(UpstreamUnavailable):
+        breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.before_call() is False
+
+def test_breaker_failed_trial_reopens():
+    breaker = CircuitBreaker("test", failure_threshold=5, reset_timeout=30)
+    for _ in range(5):
+        breaker.record_failure()
+    expire(breaker)
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+def test_breaker_released_trial_can_be_taken_again():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    expire(breaker)
+    assert breaker.before_call() is True
+    breaker.release_trial()
+    assert breaker.state == "half-open"
+    assert breaker.before_call() is True
+
+def test_bucket_slows_down_on_429_and_recovers():
+    bucket = TokenBucket(10.0, 10.0)
+    bucket.slow_down()
+    assert bucket.rate == 5.0
+    for _ in range(10):
+        bucket.slow_down()
+    assert bucket.rate == pytest.approx(1.0)
+    for _ in range(5):
+        bucket.recover()
+    assert bucket.rate == pytest.approx(3.5)
+    for _ in range(100):
+        bucket.recover()
+    assert bucket.rate == 10.0
+
+def test_exhausted_retries_count_as_one_failure(monkeypatch, upstream):
+    session = use_session(monkeypatch, [requests.ConnectionError("down")] * 4)
+    with pytest.raises(requests.ConnectionError):
+        http.request(upstream, "GET", "http://fake/")
+    assert session.calls == 4
+    breaker = throttle.breaker_for(upstream)
+    assert breaker.failures == 1
+    assert breaker.state == "closed"
+
+def test_retried_5xx_then_success_records_no_failure(monkeypatch, upstream):
+    use_session(monkeypatch, [502, 503, 200])
+    assert http.request(upstream, "GET", "http://fake/").status_code == 200
+    assert throttle.breaker_for(upstream).failures == 0
+
+def test_trial_call_keeps_the_trial_through_its_retries(monkeypatch, upstream):
+    breaker = throttle.breaker_for(upstream)
+    breaker.record_failure()
+    breaker.record_failure()
+    expire(breaker)
+    use_session(monkeypatch, [requests.ConnectionError("down"), 500, 200])
+    assert http.request(upstream, "GET", "http://fake/").status_code == 200
+    assert breaker.state == "closed"
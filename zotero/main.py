@@ -1,11 +1,21 @@
-from fastapi import APIRouter, Query
-from fastapi.responses import JSONResponse
-import requests
-import xml.etree.ElementTree as ET
-from io import BytesIO
-import fitz  # PyMuPDF
-import re
-import sys
+from fastapi import APIRouter, Body, Query
+from fastapi.responses import JSONResponse, StreamingResponse
+from clients.http import http_post
+from clients.pubmed_client import fetch_pubmed_details
+from clients.zotero_client import (
+    ZOTERO_API_BASE,
+    list_collections,
+    resolve_collection_key,
+    invalidate_collections,
+    ensure_collection,
+    create_items,
+    library_id
+)
+from clients.zotero_mirror import MIRROR_MAX_AGE, get_collection_items, count_collection_items
+from zotero.pipeline import ITEM_TIMEOUT, run_extraction, map_pdf_attachments
+from zotero.pdf_text import MAX_CHUNK_CHARS
+from jobs.runner import register_job, submit_job
+import json
 import logging
 from typing import Optional
 
@@ -14,26 +24,14 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
-ZOTERO_API_BASE = "https://api.zotero.org"
-
-SECTION_PATTERN = re.compile(
-    r"^(abstract|introduction|background|methods|materials and methods|results|findings|discussion|conclusion|references)\b",
-    re.IGNORECASE
-)
 
-def log(msg):
-    print(msg, file=sys.stderr)
+NON_ARTICLE_TYPES = ["attachment", "note", "link"]
 
 @router.get("/collections")
 def get_collections(user_id: str, api_key: str):
-    headers = {"Zotero-API-Key": api_key}
-    url = f"{ZOTERO_API_BASE}/users/{user_id}/collections"
-    response = requests.get(url, headers=headers)
-    response.raise_for_status()
-
     return [
         {"name": c["data"]["name"], "key": c["data"]["key"]}
-        for c in response.json()
+        for c in list_collections(user_id, api_key)
     ]
 
 @router.get("/items_by_collection")
@@ -42,25 +40,26 @@ def get_items_by_collection(
     api_key: str,
     collection_name: str,
     limit: int = 100,
-    start: int = 0
+    start: int = 0,
+    item_type: Optional[str] = None,
+    max_age: float = MIRROR_MAX_AGE
 ):
-    headers = {"Zotero-API-Key": api_key}
-    collections_url = f"{ZOTERO_API_BASE}/users/{user_id}/collections"
-    collections_resp = requests.get(collections_url, headers=headers)
-    collections_resp.raise_for_status()
-    collections = collections_resp.json()
-    collection_key = next((c["data"]["key"] for c in collections if c["data"]["name"] == collection_name), None)
+    collection_key = resolve_collection_key(user_id, api_key, collection_name)
     if not collection_key:
         return {"error": f"Collection '{collection_name}' not found."}
 
-    items_url = f"{ZOTERO_API_BASE}/users/{user_id}/collections/{collection_key}/items"
-    params = {"limit": limit, "start": start}
-    items_resp = requests.get(items_url, headers=headers, params=params)
-    items_resp.raise_for_status()
+    # Served from the local library mirror, synced if older than max_age seconds
+    exclude_types = None if item_type else NON_ARTICLE_TYPES
+    items = get_collection_items(
+        user_id, api_key, collection_key,
+        item_type=item_type, exclude_types=exclude_types,
+        limit=limit, start=start, max_age=max_age
+    )
 
     return {
         "collection_name": collection_name,
         "collection_key": collection_key,
+        "total": count_collection_items(user_id, api_key, collection_key, item_type, exclude_types),
         "items": [
             {
                 "title": item["data"].get("title"),
@@ -69,48 +68,53 @@ def get_items_by_collection(
                 "publication_year": item["data"].get("date", "")[:4],
                 "link": item["data"].get("url", "")
             }
-            for item in items_resp.json()
-            if item["data"].get("itemType") not in ["attachment", "note", "link"]
+            for item in items
         ]
     }
 
-SECTION_PATTERN = re.compile(
-    r"^(abstract|introduction|background|methods|materials and methods|results|findings|discussion|conclusion|references)\b",
-    re.IGNORECASE
-)
+def get_zotero_items(user_id: str, api_key: str, collection_key: str, max_age: float = MIRROR_MAX_AGE):
+    return get_collection_items(user_id, api_key, collection_key, max_age=max_age)
 
-def get_zotero_collections(user_id: str, api_key: str):
-    headers = {"Zotero-API-Key": api_key}
-    url = f"{ZOTERO_API_BASE}/users/{user_id}/collections"
-    resp = requests.get(url, headers=headers)
-    resp.raise_for_status()
-    return resp.json()
-
-def get_zotero_items(user_id: str, api_key: str, collection_key: str):
-    headers = {"Zotero-API-Key": api_key}
-    all_items = []
-    start = 0
-    limit = 100
-
-    while True:
-        url = f"{ZOTERO_API_BASE}/users/{user_id}/collections/{collection_key}/items"
-        params = {"limit": limit, "start": start}
-        resp = requests.get(url, headers=headers, params=params)
-        resp.raise_for_status()
-        batch = resp.json()
-        if not batch:
-            break
-        all_items.extend(batch)
-        start += limit
-
-    return all_items
-
-def get_children(user_id: str, api_key: str, item_key: str):
-    headers = {"Zotero-API-Key": api_key}
-    url = f"{ZOTERO_API_BASE}/users/{user_id}/items/{item_key}/children"
-    resp = requests.get(url, headers=headers)
-    resp.raise_for_status()
-    return resp.json()
+def select_articles(
+    user_id: str,
+    api_key: str,
+    collection_name: str,
+    limit_items: int,
+    start_index: int,
+    max_age: float
+):
+    # Returns (selected journal articles, parent -> PDF attachment map), or
+    # None when the collection does not exist
+    collection_key = resolve_collection_key(user_id, api_key, collection_name)
+    if not collection_key:
+        logger.info(f"Collection '{collection_name}' not found for user {user_id}")
+        return None
+
+    all_items = get_zotero_items(user_id, api_key, collection_key, max_age=max_age)
+    if logger.isEnabledFor(logging.DEBUG):
+        # Per-item detail only when asked for; building these lines is not free
+        for item in all_items:
+            logger.debug(f"Item key: {item['data'].get('key')}, title: {item['data'].get('title')}, type: {item['data'].get('itemType')}, has parent: {bool(item['data'].get('parentItem'))}")
+    journal_articles = [
+        item for item in all_items
+        if item["data"].get("itemType") == "journalArticle"
+    ]
+    selected_articles = journal_articles[start_index:start_index + limit_items]
+
+    # The collection listing already carries the attachment child items
+    attachments = map_pdf_attachments(all_items)
+    logger.info(
+        f"Collection '{collection_name}' ({collection_key}): {len(all_items)} items, "
+        f"{len(journal_articles)} journal articles, {len(selected_articles)} selected, "
+        f"{len(attachments)} PDFs in the listing"
+    )
+    return selected_articles, attachments
+
+def section_options(by_section: bool, sections: Optional[list[str]], max_chunk_chars: int):
+    # Requesting sections implies by_section; None keeps the flat "text" output
+    if not by_section and not sections:
+        return None
+    return {"sections": sections, "max_chunk_chars": max_chunk_chars}
 
 @router.get("/zotero/extract_chunks_from_collection")
 def extract_chunks_from_collection(
@@ -120,84 +124,25 @@ def extract_chunks_from_collection(
     limit_items: int = 1,
     start_index: int = 0,
     page_start: int = 1,
-    page_end: int = None
+    page_end: int = None,
+    max_age: float = MIRROR_MAX_AGE,
+    item_timeout: float = ITEM_TIMEOUT,
+    by_section: bool = False,
+    sections: Optional[list[str]] = Query(default=None),
+    max_chunk_chars: int = Query(default=MAX_CHUNK_CHARS, ge=200)
 ):
-    headers = {"Zotero-API-Key": api_key, "Zotero-API-Version": "3"}
-
-    log(f"Fetching collections for user {user_id}")
-    collections = get_zotero_collections(user_id, api_key)
-    log(f"Found collections: {[c['data']['name'] for c in collections]}")
-    collection_key = next(
-        (c["data"]["key"] for c in collections if c["data"]["name"] == collection_name), None
-    )
-    if not collection_key:
-        log(f"Collection '{collection_name}' not found.")
+    selection = select_articles(user_id, api_key, collection_name, limit_items, start_index, max_age)
+    if selection is None:
         return {"error": f"Collection '{collection_name}' not found."}
-
-    log(f"Fetching items from collection key: {collection_key}")
-    all_items = get_zotero_items(user_id, api_key, collection_key)
-    log(f"Total items fetched: {len(all_items)}")
-    for item in all_items:
-        log(f"Item key: {item['data'].get('key')}, title: {item['data'].get('title')}, type: {item['data'].get('itemType')}, has parent: {bool(item['data'].get('parentItem'))}")
-    journal_articles = [
-        item for item in all_items
-        if item["data"].get("itemType") == "journalArticle"
-    ]
-    log(f"Total journalArticles (regardless of parent status): {len(journal_articles)}")
-
-    selected_articles = journal_articles[start_index:start_index + limit_items]
-    log(f"Selected {len(selected_articles)} journalArticle items for extraction")
+    selected_articles, attachments = selection
 
     results = []
     skipped = []
-
-    for parent in selected_articles:
-        item_key = parent["data"]["key"]
-        item_title = parent["data"].get("title")
-        log(f"Processing item: {item_title} (key: {item_key})")
-
-        try:
-            children = get_children(user_id, api_key, item_key)
-            pdf = next((
-                c for c in children
-                if c.get("data", {}).get("itemType") == "attachment" and
-                   c.get("data", {}).get("contentType") == "application/pdf"
-            ), None)
-
-            if not pdf:
-                log(f"No PDF attachment found for item {item_key}")
-                skipped.append({"key": item_key, "title": item_title, "reason": "No PDF attachment"})
-                continue
-
-            pdf_key = pdf["data"]["key"]
-            pdf_url = f"{ZOTERO_API_BASE}/users/{user_id}/items/{pdf_key}/file"
-            log(f"Downloading PDF from {pdf_url}")
-            resp = requests.get(pdf_url, headers=headers, stream=True)
-            resp.raise_for_status()
-
-            doc = fitz.open(stream=BytesIO(resp.content), filetype="pdf")
-            page_count = len(doc)
-            log(f"PDF has {page_count} pages")
-
-            page_start_clamped = max(1, page_start)
-            page_end_clamped = min(page_end or page_count, page_count)
-
-            full_text = "\n".join(
-                doc[i - 1].get_text() for i in range(page_start_clamped, page_end_clamped + 1)
-            )
-            log(f"Extracted {len(full_text)} characters of text")
-
-            results.append({
-                "title": item_title,
-                "key": item_key,
-                "page_count": page_count,
-                "page_range": [page_start_clamped, page_end_clamped],
-                "text": full_text
-            })
-
-        except Exception as e:
-            log(f"Error processing item {item_key}: {e}")
-            skipped.append({"key": item_key, "title": item_title, "reason": str(e)})
+    for kind, record in run_extraction(
+        user_id, api_key, selected_articles, page_start, page_end, item_timeout, attachments,
+        section_options(by_section, sections, max_chunk_chars)
+    ):
+        (results if kind == "result" else skipped).append(record)
 
     return {
         "collection_name": collection_name,
@@ -205,6 +150,115 @@ def extract_chunks_from_collection(
         "skipped": skipped
     }
 
+@router.get("/zotero/extract_chunks_from_collection/stream")
+def stream_chunks_from_collection(
+    user_id: str,
+    api_key: str,
+    collection_name: str,
+    limit_items: int = 1,
+    start_index: int = 0,
+    page_start: int = 1,
+    page_end: int = None,
+    max_age: float = MIRROR_MAX_AGE,
+    item_timeout: float = ITEM_TIMEOUT,
+    by_section: bool = False,
+    sections: Optional[list[str]] = Query(default=None),
+    max_chunk_chars: int = Query(default=MAX_CHUNK_CHARS, ge=200),
+    format: str = Query(default="ndjson", pattern="^(ndjson|sse)$")
+):
+    # One record per article as soon as it (and every article before it) is
+    # extracted; skipped articles are sent inline and a summary comes last
+    selection = select_articles(user_id, api_key, collection_name, limit_items, start_index, max_age)
+    if selection is None:
+        return JSONResponse(status_code=404, content={"error": f"Collection '{collection_name}' not found."})
+    selected_articles, attachments = selection
+
+    def encode(kind: str, record: dict):
+        if format == "sse":
+            return f"event: {kind}\ndata: {json.dumps(record)}\n\n"
+        return json.dumps({"type": kind, **record}) + "\n"
+
+    def records():
+        counts = {"result": 0, "skipped": 0}
+        for kind, record in run_extraction(
+            user_id, api_key, selected_articles, page_start, page_end, item_timeout, attachments,
+            section_options(by_section, sections, max_chunk_chars)
+        ):
+            counts[kind] += 1
+            yield encode(kind, record)
+        yield encode("summary", {
+            "collection_name": collection_name,
+            "results": counts["result"],
+            "skipped": counts["skipped"]
+        })
+
+    media_type = "text/event-stream" if format == "sse" else "application/x-ndjson"
+    return StreamingResponse(records(), media_type=media_type)
+
+def extraction_job(params: dict, job):
+    # Background version of extract_chunks_from_collection; articles before
+    # job.resume_from were handled by an earlier run of the same job. The
+    # selection is made once and saved with the job: the mirror is ordered by
+    # modification date, so selecting again after a restart could shift it.
+    if "articles" not in params:
+        selection = select_articles(
+            params["user_id"], params["api_key"], params["collection_name"],
+            params["limit_items"], params["start_index"], params["max_age"]
+        )
+        if selection is None:
+            raise ValueError(f"Collection '{params['collection_name']}' not found.")
+        selected_articles, attachments = selection
+        params["articles"] = [
+            {"data": {"key": item["data"]["key"], "title": item["data"].get("title")}}
+            for item in selected_articles
+        ]
+        params["attachments"] = {
+            item["data"]["key"]: {"data": attachments[item["data"]["key"]]["data"]}
+            for item in selected_articles if item["data"]["key"] in attachments
+        }
+        job.save_params(params)
+    job.set_total(len(params["articles"]))
+    yield from run_extraction(
+        params["user_id"], params["api_key"], params["articles"][job.resume_from:],
+        params["page_start"], params["page_end"], params["item_timeout"], params["attachments"],
+        section_options(params["by_section"], params["sections"], params["max_chunk_chars"])
+    )
+
+register_job("zotero_extraction", extraction_job)
+
+@router.post("/zotero/extract_chunks_from_collection/jobs", status_code=202)
+def submit_extraction_job(
+    user_id: str,
+    api_key: str,
+    collection_name: str,
+    limit_items: int = 1,
+    start_index: int = 0,
+    page_start: int = 1,
+    page_end: int = None,
+    max_age: float = MIRROR_MAX_AGE,
+    item_timeout: float = ITEM_TIMEOUT,
+    by_section: bool = False,
+    sections: Optional[list[str]] = Query(default=None),
+    max_chunk_chars: int = Query(default=MAX_CHUNK_CHARS, ge=200)
+):
+    # Runs the extraction as a background job and returns it at once; poll
+    # /jobs/{id} or stream /jobs/{id}/stream (with the same user_id and
+    # api_key) for progress and results
+    return submit_job("zotero_extraction", {
+        "user_id": user_id,
+        "api_key": api_key,
+        "collection_name": collection_name,
+        "limit_items": limit_items,
+        "start_index": start_index,
+        "page_start": page_start,
+        "page_end": page_end,
+        "max_age": max_age,
+        "item_timeout": item_timeout,
+        "by_section": by_section,
+        "sections": sections,
+        "max_chunk_chars": max_chunk_chars
+    }, owner=library_id(user_id, api_key))
+
 @router.post("/create_collection")
 def create_collection(user_id: str, api_key: str, name: str):
     url = f"{ZOTERO_API_BASE}/users/{user_id}/collections"
@@ -220,10 +274,11 @@ def create_collection(user_id: str, api_key: str, name: str):
             }
         }
     ]
-    response = requests.post(url, headers=headers, json=payload)
+    response = http_post("zotero", url, headers=headers, json=payload)
     response.raise_for_status()
 
     result = response.json()
+    invalidate_collections(user_id, api_key)
     new_key = list(result.get("successful", {}).values())[0].get("key", "UNKNOWN")
 
     return {
@@ -232,6 +287,27 @@ def create_collection(user_id: str, api_key: str, name: str):
         "collection_key": new_key
     }
 
+def zotero_item_from_article(article: dict, collection_key: str) -> dict:
+    return {
+        "data": {
+            "itemType": "journalArticle",
+            "title": article["title"],
+            "abstractNote": article["abstract"],
+            "creators": [
+                {"creatorType": "author", "lastName": a["last_name"], "firstName": a["fore_name"]}
+                for a in article["author_list"]
+            ],
+            "publicationTitle": article["journal"],
+            "volume": article["volume"],
+            "issue": article["issue"],
+            "pages": article["pages"],
+            "date": article["pubdate"],
+            "DOI": article["doi"],
+            "url": article["link"],
+            "collections": [collection_key]
+        }
+    }
+
 @router.post("/add")
 def add_pubmed_article(
     user_id: str,
@@ -240,97 +316,25 @@ def add_pubmed_article(
     collection_name: str = "LitReviewGPT"
 ):
     logger.info(f"Fetching metadata for PMID: {pmid}")
-    # Step 1: Fetch article metadata from PubMed
-    efetch_url = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi"
-    params = {
-        "db": "pubmed",
-        "id": pmid,
-        "retmode": "xml"
-    }
-    efetch_resp = requests.get(efetch_url, params=params)
-    efetch_resp.raise_for_status()
-    root = ET.fromstring(efetch_resp.content)
-    article = root.find(".//PubmedArticle")
-    
-    # Basic fields
-    title = article.findtext(".//ArticleTitle")
+    # Step 1: Fetch article metadata from PubMed (served from the article cache when possible)
+    articles = fetch_pubmed_details([pmid])
+    if not articles:
+        return {"error": f"PMID {pmid} not found in PubMed."}
+    article = articles[0]
+    title = article["title"]
+    doi = article["doi"]
     logger.info(f"Fetched title: {title}")
-    abstract = " ".join(
-        elem.text.strip() for elem in article.findall(".//AbstractText") if elem.text
-    )
-    journal = article.findtext(".//Journal/Title")
-    volume = article.findtext(".//JournalIssue/Volume")
-    issue = article.findtext(".//JournalIssue/Issue")
-    pages = article.findtext(".//Pagination/MedlinePgn")
-    pubdate = article.findtext(".//PubDate/Year") or article.findtext(".//PubDate/MedlineDate")
-    doi = None
-    for eid in article.findall(".//ELocationID"):
-        if eid.attrib.get("EIdType") == "doi":
-            doi = eid.text
-            break
-    link = f"https://pubmed.ncbi.nlm.nih.gov/{pmid}/"
-
-    # Authors
-    creators = []
-    for author in article.findall(".//Author"):
-        last = author.findtext("LastName")
-        first = author.findtext("ForeName")
-        if last:
-            creators.append({
-                "creatorType": "author",
-                "lastName": last,
-                "firstName": first or ""
-            })
 
     # Step 2: Ensure collection exists
     logger.info(f"Ensuring collection '{collection_name}' exists")
-    headers = {
-        "Zotero-API-Key": api_key,
-        "Zotero-API-Version": "3"
-    }
-    collections_url = f"{ZOTERO_API_BASE}/users/{user_id}/collections"
-    collections_resp = requests.get(collections_url, headers=headers)
-    collections_resp.raise_for_status()
-    collections = collections_resp.json()
-    collection_key = next((c["data"]["key"] for c in collections if c["data"]["name"] == collection_name), None)
-
-    if not collection_key:
-        create_resp = requests.post(
-            collections_url,
-            headers={**headers, "Content-Type": "application/json"},
-            json=[{"data": {"name": collection_name}}]
-        )
-        create_resp.raise_for_status()
-        collection_key = list(create_resp.json()["successful"].values())[0]["key"]
-        logger.info(f"Created collection '{collection_name}' with key: {collection_key}")
+    collection_key = ensure_collection(user_id, api_key, collection_name)
 
     # Step 3: Construct Zotero item
-    item_payload = [
-        {
-            "data": {
-                "itemType": "journalArticle",
-                "title": title,
-                "abstractNote": abstract,
-                "creators": creators,
-                "publicationTitle": journal,
-                "volume": volume,
-                "issue": issue,
-                "pages": pages,
-                "date": pubdate,
-                "DOI": doi,
-                "url": link,
-                "collections": [collection_key]
-            }
-        }
-    ]
+    item_payload = [zotero_item_from_article(article, collection_key)]
     logger.info(f"Posting item to Zotero: {title}")
-    item_url = f"{ZOTERO_API_BASE}/users/{user_id}/items"
-    item_resp = requests.post(
-        item_url,
-        headers={**headers, "Content-Type": "application/json"},
-        json=item_payload
-    )
-    item_resp.raise_for_status()
+    outcome = create_items(user_id, api_key, item_payload)[0]
+    if "error" in outcome:
+        return {"error": f"Zotero rejected PMID {pmid}: {outcome['error']}"}
     logger.info(f"Successfully added PMID {pmid} to Zotero collection '{collection_name}'")
 
     return {
@@ -340,3 +344,59 @@ def add_pubmed_article(
         "doi": doi,
         "collection": collection_name
     }
+
+@router.post("/add_bulk")
+def add_pubmed_articles_bulk(
+    user_id: str,
+    api_key: str,
+    pmids: list[str] = Body(..., embed=True),
+    collection_name: str = "LitReviewGPT"
+):
+    pmids = list(dict.fromkeys(p.strip() for p in pmids if p.strip()))
+    logger.info(f"Bulk import of {len(pmids)} PMIDs into '{collection_name}'")
+
+    # Step 1: Metadata in chunked efetch calls (cached records are not refetched)
+    articles = {article["pmid"]: article for article in fetch_pubmed_details(pmids)}
+
+    # Step 2: Resolve the collection once and skip articles already in it,
+    # matched on the PubMed URL or DOI
+    collection_key = ensure_collection(user_id, api_key, collection_name)
+    existing_urls, existing_dois = set(), set()
+    for item in get_collection_items(user_id, api_key, collection_key, max_age=0):
+        existing_urls.add(item["data"].get("url"))
+        if item["data"].get("DOI"):
+            existing_dois.add(item["data"]["DOI"].lower())
+
+    report = {}
+    to_write = []
+    for pmid in pmids:
+        article = articles.get(pmid)
+        if article is None:
+            report[pmid] = {"status": "not_found"}
+        elif article["link"] in existing_urls or (article["doi"] and article["doi"].lower() in existing_dois):
+            report[pmid] = {"status": "duplicate", "title": article["title"]}
+        else:
+            to_write.append(pmid)
+
+    # Step 3: Write in batches of 50 items per request; a failed batch marks
+    # only its own PMIDs as failed
+    outcomes = create_items(
+        user_id, api_key, [zotero_item_from_article(articles[pmid], collection_key) for pmid in to_write]
+    )
+    for pmid, outcome in zip(to_write, outcomes):
+        if "key" in outcome:
+            report[pmid] = {"status": "added", "title": articles[pmid]["title"], "item_key": outcome["key"]}
+        else:
+            report[pmid] = {"status": "failed", "title": articles[pmid]["title"], "reason": outcome["error"]}
+
+    counts = {}
+    for entry in report.values():
+        counts[entry["status"]] = counts.get(entry["status"], 0) + 1
+    logger.info(f"Bulk import into '{collection_name}': {counts}")
+
+    return {
+        "collection": collection_name,
+        "collection_key": collection_key,
+        "counts": counts,
+        "results": [{"pmid": pmid, **report[pmid]} for pmid in pmids]
+    }
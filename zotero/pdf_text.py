@@ -0,0 +1,209 @@
+import re
+
+# CPU-bound PDF text extraction. Kept free of app imports because it runs
+# inside worker processes.
+
+# A heading is a line holding only an optional number, the section name and
+# optional trailing punctuation. "Methods: We enrolled..." (a structured
+# abstract label) and wrapped body lines such as "results of the..." are body
+# text.
+SECTION_PATTERN = re.compile(
+    r"^(?:\d+(?:\.\d+)*\.?\s+)?(abstract|introduction|background|methods|materials and methods|results|findings|discussion|conclusions?|references)\s*[:.]?\s*$",
+    re.IGNORECASE
+)
+SECTION_ALIASES = {"materials and methods": "methods", "findings": "results", "conclusions": "conclusion"}
+# Sections that double as structured-abstract labels
+ABSTRACT_LABELS = {"background", "methods", "results", "conclusion"}
+MAX_CHUNK_CHARS = 2000
+# Bold (PyMuPDF span flag) or at least this much larger than the page's body
+# text counts as heading type
+BOLD_FLAG = 16
+HEADING_SIZE_RATIO = 1.1
+
+def normalize_section(name: str) -> str:
+    name = " ".join(name.lower().split())
+    return SECTION_ALIASES.get(name, name)
+
+def styled_lines(page) -> list:
+    # (text, heading_type) for each line of a PyMuPDF page, in reading order.
+    # Heading type is bold, or larger than the page's most common (body) font
+    # size.
+    lines, sizes = [], {}
+    for block in page.get_text("dict")["blocks"]:
+        for line in block.get("lines", []):
+            spans = [span for span in line["spans"] if span["text"].strip()]
+            if not spans:
+                continue
+            lines.append(spans)
+            for span in spans:
+                size = round(span["size"], 1)
+                sizes[size] = sizes.get(size, 0) + len(span["text"])
+    if not sizes:
+        return []
+    body_size = max(sizes, key=sizes.get)
+    result = []
+    for spans in lines:
+        bold = all(span["flags"] & BOLD_FLAG for span in spans)
+        larger = min(span["size"] for span in spans) >= body_size * HEADING_SIZE_RATIO
+        result.append(("".join(span["text"] for span in spans).strip(), bold or larger))
+    return result
+
+def section_lines(page) -> list:
+    # styled_lines(page) when the page sets at least one heading in heading
+    # type, else [] (the chunker then reads the plain text). This is what the
+    # chunker uses and what is stored with a page, so stored pages chunk the
+    # same way as freshly extracted ones.
+    lines = styled_lines(page)
+    return lines if any(match_heading(line, styled) for line, styled in lines) else []
+
+def match_heading(line: str, heading_type: bool = None) -> str:
+    # Section name if line is a heading, else None. Headings are capitalised,
+    # which keeps out a wrapped body line that is just "results."; when font
+    # information is known (heading_type not None) the line must also be set
+    # in heading type.
+    match = SECTION_PATTERN.match(line)
+    if not match or not match.group(1)[0].isupper() or heading_type is False:
+        return None
+    return normalize_section(match.group(1))
+
+class SectionChunker:
+    # Single pass over page text: lines that are section headings start a new
+    # section, everything else is appended to the current one in chunks of at
+    # most max_chunk_chars. Inside the abstract, "Methods:"-style labels on a
+    # line of their own belong to a structured abstract and stay in it; a
+    # bare "Methods" there may be a label or the real section, so it is kept
+    # provisionally and replaced if the real section comes later. With a
+    # sections filter, feed_page returns False once every requested section
+    # has been read (outside the abstract) and another section starts, so the
+    # caller can stop parsing.
+
+    def __init__(self, sections: list[str] = None, max_chunk_chars: int = MAX_CHUNK_CHARS):
+        self.wanted = {normalize_section(s) for s in sections} if sections else None
+        self.max_chunk_chars = max(1, max_chunk_chars)
+        self.sections = {}
+        self.current = "preamble"
+        self.seen = set()
+        self.provisional = set()
+        self.in_abstract = False
+        self.done = False
+        self._buffer = []
+        self._buffer_len = 0
+
+    def _keep(self, section: str) -> bool:
+        return self.wanted is None or section in self.wanted
+
+    def _flush(self):
+        if self._buffer and self._keep(self.current):
+            self.sections.setdefault(self.current, []).append("\n".join(self._buffer))
+        self._buffer = []
+        self._buffer_len = 0
+
+    def _start_section(self, name: str):
+        self._flush()
+        if self.in_abstract and name in ABSTRACT_LABELS:
+            # Not counted as seen, so it cannot trigger the early stop
+            self.provisional.add(name)
+            self.current = name
+            return
+        self.in_abstract = name == "abstract"
+        if name in self.provisional:
+            self.provisional.discard(name)
+            self.sections.pop(name, None)
+        if self.wanted is not None and self.wanted <= self.seen and name not in self.wanted:
+            self.done = True
+            return
+        self.current = name
+        self.seen.add(name)
+
+    def feed_page(self, text: str, lines: list = None) -> bool:
+        # lines: the page as styled_lines() (or section_lines()) when font
+        # information is available. It is only trusted on pages where at least
+        # one heading is actually set in heading type.
+        if lines is None or not any(match_heading(line, styled) for line, styled in lines):
+            lines = [(line.strip(), None) for line in text.splitlines()]
+        for line, styled in lines:
+            if not line:
+                continue
+            section = match_heading(line, styled)
+            if section and not (self.current == "abstract" and line.endswith(":") and section != "introduction"):
+                self._start_section(section)
+                if self.done:
+                    return False
+                continue
+            if not self._keep(self.current):
+                continue
+            if self._buffer and self._buffer_len + len(line) + 1 > self.max_chunk_chars:
+                self._flush()
+            self._buffer.append(line)
+            self._buffer_len += len(line) + 1
+        return True
+
+    def result(self) -> dict:
+        self._flush()
+        return self.sections
+
+def chunk_sections(
+    pages: list[str],
+    sections: list[str] = None,
+    max_chunk_chars: int = MAX_CHUNK_CHARS,
+    lines: list = None
+) -> dict:
+    # lines: section_lines() per page, when known
+    chunker = SectionChunker(sections, max_chunk_chars)
+    for i, text in enumerate(pages):
+        if not chunker.feed_page(text, lines[i] if lines else None):
+            break
+    return chunker.result()
+
+def open_pdf(source):
+    import fitz  # PyMuPDF
+
+    # A path is opened straight from disk; bytes are wrapped as a stream
+    if isinstance(source, str):
+        return fitz.open(source, filetype="pdf")
+    return fitz.open(stream=source, filetype="pdf")
+
+def extract_pdf_pages(source, page_start: int = 1, page_end: int = None):
+    with open_pdf(source) as doc:
+        page_count = len(doc)
+        page_start_clamped = max(1, page_start)
+        page_end_clamped = min(page_end or page_count, page_count)
+        pages = [doc[i - 1].get_text() for i in range(page_start_clamped, page_end_clamped + 1)]
+
+    return {
+        "page_count": page_count,
+        "page_range": [page_start_clamped, page_end_clamped],
+        "pages": pages
+    }
+
+def extract_pdf_sections(
+    source,
+    page_start: int = 1,
+    page_end: int = None,
+    sections: list[str] = None,
+    max_chunk_chars: int = MAX_CHUNK_CHARS
+):
+    # Pages are extracted lazily and parsing stops as soon as the requested
+    # sections are complete; "pages" holds only the pages actually parsed and
+    # "lines" their section_lines().
+    chunker = SectionChunker(sections, max_chunk_chars)
+    pages, lines = [], []
+    with open_pdf(source) as doc:
+        page_count = len(doc)
+        page_start_clamped = max(1, page_start)
+        page_end_clamped = min(page_end or page_count, page_count)
+        for i in range(page_start_clamped, page_end_clamped + 1):
+            page = doc[i - 1]
+            pages.append(page.get_text())
+            lines.append(section_lines(page))
+            if not chunker.feed_page(pages[-1], lines[-1]):
+                break
+
+    return {
+        "page_count": page_count,
+        "page_range": [page_start_clamped, page_end_clamped],
+        "pages_parsed": len(pages),
+        "pages": pages,
+        "lines": lines,
+        "sections": chunker.result()
+    }
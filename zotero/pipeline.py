@@ -0,0 +1,285 @@
+import os
+import time
+import tempfile
+import threading
+import logging
+import multiprocessing
+import collections
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from clients import metrics, pdf_cache, page_text_store, search_index
+from clients.zotero_client import get_children, download_attachment, library_id
+from zotero.pdf_text import extract_pdf_pages, extract_pdf_sections, chunk_sections
+
+# Set up basic logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Network stages (children lookup, download) run on a thread pool; PyMuPDF
+# extraction runs on a process pool sized to the machine's cores.
+NETWORK_WORKERS = int(os.getenv("ZOTERO_NETWORK_WORKERS", "8"))
+EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", str(os.cpu_count() or 1)))
+ITEM_TIMEOUT = float(os.getenv("ZOTERO_ITEM_TIMEOUT", "120"))
+
+_network_executor = None
+_process_executor = None
+_executor_lock = threading.Lock()
+
+class _InFlight:
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def add(self, n: int):
+        with self._lock:
+            self.value += n
+
+# PDFs submitted to the process pool and not finished yet
+_in_flight = _InFlight()
+metrics.Gauge("littools_pdf_extractions_in_flight", "PDF extractions queued or running on the process pool", lambda: _in_flight.value)
+
+def _network_pool() -> ThreadPoolExecutor:
+    global _network_executor
+    with _executor_lock:
+        if _network_executor is None:
+            _network_executor = ThreadPoolExecutor(max_workers=NETWORK_WORKERS, thread_name_prefix="zotero-net")
+        return _network_executor
+
+def _process_pool() -> ProcessPoolExecutor:
+    global _process_executor
+    with _executor_lock:
+        if _process_executor is None:
+            # spawn: forking a threaded server process is not safe
+            _process_executor = ProcessPoolExecutor(
+                max_workers=EXTRACT_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _process_executor
+
+def _reset_process_pool():
+    global _process_executor
+    with _executor_lock:
+        if _process_executor is not None:
+            _process_executor.shutdown(wait=False, cancel_futures=True)
+            _process_executor = None
+
+def shutdown_executors():
+    global _network_executor, _process_executor
+    with _executor_lock:
+        if _network_executor is not None:
+            _network_executor.shutdown(wait=False, cancel_futures=True)
+            _network_executor = None
+        if _process_executor is not None:
+            _process_executor.shutdown(wait=False, cancel_futures=True)
+            _process_executor = None
+
+def find_pdf_attachment(children: list):
+    return next((
+        c for c in children
+        if c.get("data", {}).get("itemType") == "attachment" and
+           c.get("data", {}).get("contentType") == "application/pdf"
+    ), None)
+
+def map_pdf_attachments(items: list) -> dict:
+    # parent key -> first PDF attachment, from a listing that already
+    # contains child items
+    attachments = {}
+    for item in items:
+        parent_key = item["data"].get("parentItem")
+        if parent_key and parent_key not in attachments and find_pdf_attachment([item]):
+            attachments[parent_key] = item
+    return attachments
+
+def fetch_pdf(user_id: str, api_key: str, attachment: dict):
+    # Returns (path, is_temporary). Cacheable files are streamed into the
+    # local PDF cache; files without an md5/mtime go to a temporary file the
+    # caller removes after extraction.
+    attachment_key = attachment["data"]["key"]
+    key = pdf_cache.cache_key(attachment)
+    if key:
+        path = pdf_cache.get_pdf_path(key)
+        metrics.record_cache("pdf", hits=bool(path), misses=not path)
+        if path:
+            logger.debug(f"PDF cache hit for attachment {attachment_key}")
+            return path, False
+        tmp_path = pdf_cache.temp_path(key)
+    else:
+        fd, tmp_path = tempfile.mkstemp(suffix=".pdf")
+        os.close(fd)
+
+    try:
+        with open(tmp_path, "wb") as f:
+            size = download_attachment(user_id, api_key, attachment_key, f)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    logger.debug(f"Downloaded attachment {attachment_key} ({size} bytes)")
+    if key:
+        return pdf_cache.commit_pdf(key, tmp_path), False
+    return tmp_path, True
+
+def extract_attachment(
+    user_id: str,
+    api_key: str,
+    pdf: dict,
+    page_start: int,
+    page_end: int,
+    deadline: float,
+    section_options: dict = None,
+    parent: dict = None
+):
+    # Stored page text answers the request without touching the PDF; only a
+    # miss downloads (or reuses the cached file) and runs PyMuPDF.
+    # section_options ({"sections", "max_chunk_chars"}) adds a "sections" map.
+    # Freshly extracted pages are added to the local search index under the
+    # parent item, visible only to searches with this library's credentials.
+    doc_key = pdf_cache.cache_key(pdf)
+    if doc_key:
+        # Sections are chunked from the stored styled lines, as on extraction
+        stored = page_text_store.get_page_range(doc_key, page_start, page_end, with_lines=section_options is not None)
+        metrics.record_cache("page_text", hits=stored is not None, misses=stored is None)
+        if stored is not None:
+            if section_options is not None:
+                stored["sections"] = chunk_sections(stored["pages"], lines=stored.pop("lines"), **section_options)
+            return stored
+
+    pdf_path, is_temporary = fetch_pdf(user_id, api_key, pdf)
+    if section_options is not None:
+        task = (extract_pdf_sections, pdf_path, page_start, page_end, section_options["sections"], section_options["max_chunk_chars"])
+    else:
+        task = (extract_pdf_pages, pdf_path, page_start, page_end)
+    _in_flight.add(1)
+    started = time.perf_counter()
+    try:
+        extracted = _process_pool().submit(*task).result(
+            timeout=max(0, deadline - time.monotonic())
+        )
+        metrics.PDF_EXTRACTION_SECONDS.observe(time.perf_counter() - started)
+        metrics.PDF_PAGES_EXTRACTED.inc(len(extracted["pages"]))
+    except BrokenProcessPool:
+        # A worker died (e.g. PyMuPDF crashed on a malformed file); start fresh
+        _reset_process_pool()
+        raise RuntimeError("PDF extraction worker crashed")
+    finally:
+        _in_flight.add(-1)
+        if is_temporary:
+            os.remove(pdf_path)
+
+    if doc_key:
+        page_text_store.put_pages(
+            doc_key, extracted["page_count"], extracted["page_range"][0], extracted["pages"], extracted.get("lines"),
+            pdf["data"]["key"]
+        )
+    if parent is not None:
+        search_index.index_pdf_pages(
+            library_id(user_id, api_key), parent["data"]["key"], parent["data"].get("title"), extracted["page_range"][0],
+            extracted["pages"], pdf["data"]["key"]
+        )
+    return extracted
+
+def process_article(
+    user_id: str,
+    api_key: str,
+    parent: dict,
+    page_start: int,
+    page_end: int,
+    item_timeout: float,
+    pdf: dict = None,
+    section_options: dict = None
+):
+    # Returns ("result", record) or ("skipped", record)
+    deadline = time.monotonic() + item_timeout
+    item_key = parent["data"]["key"]
+    item_title = parent["data"].get("title")
+
+    if pdf is None:
+        # Not in the bulk listing; ask Zotero for this item's children
+        pdf = find_pdf_attachment(get_children(user_id, api_key, item_key))
+    if not pdf:
+        logger.debug(f"No PDF attachment found for item {item_key}")
+        return "skipped", {"key": item_key, "title": item_title, "reason": "No PDF attachment"}
+
+    extracted = extract_attachment(user_id, api_key, pdf, page_start, page_end, deadline, section_options, parent)
+    record = {
+        "title": item_title,
+        "key": item_key,
+        "page_count": extracted["page_count"],
+        "page_range": extracted["page_range"]
+    }
+    if section_options is not None:
+        record["sections"] = extracted["sections"]
+        logger.debug(f"Extracted {len(record['sections'])} sections from item {item_key}")
+    else:
+        record["text"] = "\n".join(extracted["pages"])
+        logger.debug(f"Extracted {len(record['text'])} characters from item {item_key}")
+    return "result", record
+
+def _started_article(started: list, *args):
+    # Runs process_article on a pool thread, noting when it actually started
+    started.append(time.monotonic())
+    return process_article(*args)
+
+def _article_result(future, started: list, item_timeout: float):
+    # An item's timeout runs from when a worker picked it up, not from when
+    # it was queued behind other runs' work on the shared pool
+    while True:
+        wait = started[0] + item_timeout - time.monotonic() if started else item_timeout
+        try:
+            return future.result(timeout=max(0, wait))
+        except TimeoutError:
+            if started and time.monotonic() >= started[0] + item_timeout:
+                raise
+
+def run_extraction(
+    user_id: str,
+    api_key: str,
+    articles: list,
+    page_start: int = 1,
+    page_end: int = None,
+    item_timeout: float = ITEM_TIMEOUT,
+    attachments: dict = None,
+    section_options: dict = None
+):
+    # Yields ("result" | "skipped", record) per article in input order while
+    # the next few articles are already being downloaded and extracted. At
+    # most NETWORK_WORKERS articles per run are queued on the shared pool, so
+    # a long run does not hold up interactive requests behind all of its
+    # items.
+    # attachments maps parent keys to known PDF attachments (see
+    # map_pdf_attachments); only articles missing from it cost a children call.
+    attachments = attachments or {}
+    remaining = iter(articles)
+    pending = collections.deque()
+
+    def submit_next():
+        parent = next(remaining, None)
+        if parent is not None:
+            started = []
+            future = _network_pool().submit(
+                _started_article, started, user_id, api_key, parent, page_start, page_end, item_timeout,
+                attachments.get(parent["data"]["key"]), section_options
+            )
+            pending.append((parent, future, started))
+
+    for _ in range(max(1, NETWORK_WORKERS)):
+        submit_next()
+    try:
+        while pending:
+            parent, future, started = pending.popleft()
+            item_key = parent["data"]["key"]
+            item_title = parent["data"].get("title")
+            try:
+                outcome = _article_result(future, started, item_timeout)
+            except TimeoutError:
+                future.cancel()
+                logger.warning(f"Timed out processing item {item_key}")
+                outcome = "skipped", {"key": item_key, "title": item_title, "reason": f"Timed out after {item_timeout}s"}
+            except Exception as e:
+                logger.warning(f"Error processing item {item_key}: {e}")
+                outcome = "skipped", {"key": item_key, "title": item_title, "reason": str(e)}
+            submit_next()
+            yield outcome
+    finally:
+        # Drop queued work if the consumer stops early
+        for _, future, _ in pending:
+            future.cancel()